@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Files kept in the session directory, so a restarted process can still report on the job
+JOB_STATE_FILE = 'job.json'
+JOB_RESULT_FILE = 'summary.json'
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Serializes read-modify-write cycles on job.json within this process
+_state_lock = threading.Lock()
+
+class JobCancelled(Exception):
+    """Raised inside a running job once its cancellation was requested"""
+
+def read_job_state(session_dir):
+    """Return the saved job state of a session, or None if it never ran a job"""
+    state_path = os.path.join(session_dir, JOB_STATE_FILE)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_job_state(session_dir, state):
+    state['updated'] = time.time()
+    state_path = os.path.join(session_dir, JOB_STATE_FILE)
+    tmp_path = f'{state_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+def update_job_state(session_dir, update):
+    """Apply update(state) to the saved job state and write it back"""
+    with _state_lock:
+        state = read_job_state(session_dir)
+        if state is None:
+            return None
+        update(state)
+        write_job_state(session_dir, state)
+        return state
+
+def read_job_result(session_dir):
+    with open(os.path.join(session_dir, JOB_RESULT_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+class JobQueue:
+    """Runs analysis jobs on a local thread pool and tracks their cancellation flags"""
+
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, session_dir, file_names, func):
+        """Queue func(progress) for a session; its return value is saved as the job result"""
+        # Register first, so a status request never sees a queued job as lost
+        cancel_event = threading.Event()
+        with self._lock:
+            self._cancel_events[job_id] = cancel_event
+
+        with _state_lock:
+            write_job_state(session_dir, {
+                'job_id': job_id,
+                'status': 'queued',
+                'created': time.time(),
+                'total': len(file_names),
+                'done': 0,
+                'files': {name: 'pending' for name in file_names},
+                'error': None
+            })
+        self._executor.submit(self._run, job_id, session_dir, func, cancel_event)
+
+    def is_active(self, job_id):
+        with self._lock:
+            return job_id in self._cancel_events
+
+    def cancel(self, job_id, session_dir):
+        """Request cancellation; returns False if the job is not running in this process"""
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        update_job_state(session_dir, lambda state: state.update(cancel_requested=True))
+        return True
+
+    def status(self, job_id, session_dir):
+        """Return the job state, marking jobs lost by a restart as interrupted"""
+        def mark_interrupted(state):
+            # Re-checked under the lock: the job may have finished in the meantime
+            if state['status'] in ACTIVE_STATUSES:
+                state['status'] = 'interrupted'
+
+        state = read_job_state(session_dir)
+        if state is not None and state['status'] in ACTIVE_STATUSES and not self.is_active(job_id):
+            state = update_job_state(session_dir, mark_interrupted)
+        return state
+
+    def _run(self, job_id, session_dir, func, cancel_event):
+        def set_status(status, error=None):
+            update_job_state(session_dir, lambda state: state.update(status=status, error=error))
+
+        def progress(original_filename, error=None):
+            def mark_file(state):
+                state['files'][original_filename] = 'failed' if error is not None else 'done'
+                state['done'] += 1
+            update_job_state(session_dir, mark_file)
+            if cancel_event.is_set():
+                raise JobCancelled()
+
+        try:
+            if cancel_event.is_set():
+                raise JobCancelled()
+            set_status('running')
+
+            result = func(progress)
+
+            result_path = os.path.join(session_dir, JOB_RESULT_FILE)
+            with open(result_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            set_status('done')
+        except JobCancelled:
+            set_status('cancelled')
+        except Exception as e:
+            print(f"Analysis job {job_id} failed: {e}")
+            set_status('failed', str(e))
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
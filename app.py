@@ -1,11 +1,32 @@
 from flask import Flask, render_template, request, jsonify, send_file
+import gzip
+import hmac
+import io
+import json
 import os
 import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 import extract_employee_shifts
+import roster_engine
+import roster_tables
+import analysis_jobs
+import session_state
+import shift_store
+import upload_store
+import result_cache
+import session_reaper
+import metrics
+import profiling
 import shutil
-from docx import Document
-import re
+import zip_stream
+from shift_model import Shift, format_date, parse_date
+
+try:
+    import brotli  # Optional: summaries are gzip-compressed without it
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this in production
@@ -14,13 +35,48 @@ app.secret_key = 'your-secret-key-here'  # Change this in production
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'docx'}
 MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))  # Parsing processes, 0 = one per CPU core
+TABLE_BACKEND = os.environ.get('TABLE_BACKEND', 'python-docx')  # 'python-docx' or 'stream'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # Analysis jobs running at the same time
+SHIFT_STORE_PATH = os.environ.get('SHIFT_STORE_PATH', 'shift_store.db')  # SQLite shift store
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 50 * 1024 * 1024))  # Cached summaries on disk
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 100 * 1024 * 1024))  # Cached employee reports on disk
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 24 * 3600))  # Seconds an unused session is kept
+UPLOADS_QUOTA_BYTES = int(os.environ.get('UPLOADS_QUOTA_BYTES', 2 * 1024 ** 3))  # Disk quota of the upload folder
+REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', 300))  # Seconds between reaper passes, 0 = disabled
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', 'off')  # 'off', 'header' (X-Profile: 1) or 'always'
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # Sent as X-Admin-Token to reach the admin routes; empty = admin routes off
+SUMMARY_FORMATS = ('nested', 'columnar')  # ?format= of heatmap summaries
+COMPRESS_MIN_BYTES = 1024  # Smaller summary responses are sent as they are
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')  # Raw .zip request bodies
+MAX_ARCHIVE_BYTES = int(os.environ.get('MAX_ARCHIVE_BYTES', 500 * 1024 * 1024))  # Uncompressed bytes all .zip archives of an upload may unpack to
+MAX_ARCHIVE_MEMBERS = int(os.environ.get('MAX_ARCHIVE_MEMBERS', 2000))  # Members all .zip archives of an upload may hold
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['PARSE_WORKERS'] = PARSE_WORKERS
+app.config['TABLE_BACKEND'] = TABLE_BACKEND
+app.config['SHIFT_STORE_PATH'] = SHIFT_STORE_PATH
+app.config['RESULT_CACHE_MAX_BYTES'] = RESULT_CACHE_MAX_BYTES
+app.config['REPORT_CACHE_MAX_BYTES'] = REPORT_CACHE_MAX_BYTES
+app.config['SESSION_TTL'] = SESSION_TTL
+app.config['UPLOADS_QUOTA_BYTES'] = UPLOADS_QUOTA_BYTES
+app.config['PROFILE_REQUESTS'] = PROFILE_REQUESTS
+app.config['ADMIN_TOKEN'] = ADMIN_TOKEN
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Local worker pool for background analysis jobs
+job_queue = analysis_jobs.JobQueue(JOB_WORKERS)
+
+# Background removal of abandoned sessions; sessions with a running job are left alone
+reaper = session_reaper.SessionReaper(UPLOAD_FOLDER, SESSION_TTL, UPLOADS_QUOTA_BYTES, REAPER_INTERVAL,
+                                      is_busy=job_queue.is_active)
+# Not in the fork server of the parsing pool, which imports this module as __mp_main__ when run as a script
+if __name__ != '__mp_main__':
+    reaper.start()
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -42,406 +98,874 @@ def index():
 @app.route('/analyze', methods=['POST'])
 def analyze_files():
     """Analyze uploaded files and return summary data for heatmap"""
+    with metrics.collect('analyze') as request_metrics:
+        return run_profiled('analyze', analyze_request, request_metrics)
+
+def analyze_request(request_metrics):
+    """Body of /analyze, timed stage by stage"""
     try:
-        if 'files' not in request.files:
-            return jsonify({'error': 'No files selected'}), 400
+        files, archives = read_uploaded_archives()
+        references = read_file_references()
         
-        files = request.files.getlist('files')
+        if references is None:
+            return jsonify({'error': 'Invalid manifest'}), 400
         
-        if len(files) == 0:
+        if len(files) == 0 and len(archives) == 0 and not references:
             return jsonify({'error': 'No files selected'}), 400
         
-        # Create a temporary directory for this analysis
-        session_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER)
-        
-        # Save uploaded files with filename mapping
-        uploaded_files = []
-        filename_mapping = {}
-        for file in files:
-            if file and file.filename and allowed_file(file.filename):
-                original_filename = file.filename
-                secure_name = secure_filename(file.filename)
-                file_path = os.path.join(session_dir, secure_name)
-                file.save(file_path)
-                
-                filename_mapping[secure_name] = original_filename
-                uploaded_files.append(secure_name)
+        # Files referenced by hash must already be stored
+        missing = upload_store.missing_hashes(UPLOAD_FOLDER, [content_hash for _, content_hash in references])
+        if missing:
+            return jsonify({'error': 'Some files are not stored yet, upload them', 'missing': missing}), 409
         
-        if not uploaded_files:
-            shutil.rmtree(session_dir)
+        try:
+            with metrics.stage('save'):
+                session_dir, filename_mapping = save_uploaded_files(files, references, archives)
+        except zip_stream.ZipStreamError as e:
+            return archive_error_response(e)
+        
+        if session_dir is None:
             return jsonify({'error': 'No valid .docx files uploaded'}), 400
         
-        # Save filename mapping for later use
-        mapping_file = os.path.join(session_dir, 'filename_mapping.txt')
-        with open(mapping_file, 'w', encoding='utf-8') as f:
-            for secure_name, original_name in filename_mapping.items():
-                f.write(f'{secure_name}:{original_name}\n')
+        profiling.attach(session_dir)
         
         # Analyze all employees and shifts
-        summary_data = analyze_all_employees(session_dir, filename_mapping)
+        summary_data = analyze_all_employees(session_dir)
+        
+        with metrics.stage('serialize'):
+            return summary_response(summary_data, os.path.basename(session_dir), debug_metrics(request_metrics))
+        
+    except HTTPException:
+        raise  # e.g. 413 for a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+
+@app.route('/jobs/analyze', methods=['POST'])
+def submit_analysis_job():
+    """Save uploaded files and queue their analysis; returns the job ID at once"""
+    try:
+        files, archives = read_uploaded_archives()
+        references = read_file_references()
+        
+        if references is None:
+            return jsonify({'error': 'Invalid manifest'}), 400
+        
+        if len(files) == 0 and len(archives) == 0 and not references:
+            return jsonify({'error': 'No files selected'}), 400
+        
+        missing = upload_store.missing_hashes(UPLOAD_FOLDER, [content_hash for _, content_hash in references])
+        if missing:
+            return jsonify({'error': 'Some files are not stored yet, upload them', 'missing': missing}), 409
+        
+        try:
+            session_dir, filename_mapping = save_uploaded_files(files, references, archives)
+        except zip_stream.ZipStreamError as e:
+            return archive_error_response(e)
+        
+        if session_dir is None:
+            return jsonify({'error': 'No valid .docx files uploaded'}), 400
+        
+        # The session directory doubles as the job ID
+        job_id = os.path.basename(session_dir)
+        profiled = profiling_requested()
+        job_queue.submit(job_id, session_dir, list(filename_mapping.values()),
+                         lambda progress: analyze_job(session_dir, progress, profiled))
         
         return jsonify({
             'success': True,
-            'session_dir': os.path.basename(session_dir),
-            'summary': summary_data
+            'job_id': job_id,
+            'session_dir': job_id,
+            'status_url': f'/jobs/{job_id}'
+        }), 202
+        
+    except HTTPException:
+        raise  # e.g. 413 for a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({'error': f'Could not start analysis: {str(e)}'}), 500
+
+@app.route('/uploads/negotiate', methods=['POST'])
+def negotiate_upload():
+    """Tell the client which of its files (by SHA-256 hex digest) it still has to upload"""
+    data = request.get_json(silent=True) or {}
+    hashes = data.get('hashes', [])
+    
+    if not isinstance(hashes, list) or not all(isinstance(content_hash, str) for content_hash in hashes):
+        return jsonify({'error': 'Expected a list of hashes'}), 400
+    
+    return jsonify({
+        'success': True,
+        'missing': upload_store.missing_hashes(UPLOAD_FOLDER, hashes)
+    })
+
+@app.route('/jobs/<job_id>')
+def analysis_job_status(job_id):
+    """Report the status and per-file progress of an analysis job"""
+    session_dir = get_session_dir(job_id)
+    state = job_queue.status(job_id, session_dir) if session_dir else None
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/result')
+def analysis_job_result(job_id):
+    """Return the heatmap summary of a finished analysis job"""
+    session_dir = get_session_dir(job_id)
+    state = job_queue.status(job_id, session_dir) if session_dir else None
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if state['status'] != 'done':
+        return jsonify({'error': f"Job is {state['status']}", 'status': state['status']}), 409
+    
+    return summary_response(analysis_jobs.read_job_result(session_dir), job_id)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_analysis_job(job_id):
+    """Stop a queued or running analysis job after the file being parsed"""
+    session_dir = get_session_dir(job_id)
+    state = job_queue.status(job_id, session_dir) if session_dir else None
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not job_queue.cancel(job_id, session_dir):
+        return jsonify({'error': f"Job is already {state['status']}", 'status': state['status']}), 409
+    
+    return jsonify({'success': True, 'status': 'cancelling'})
+
+@app.route('/sessions/<session_id>/files', methods=['POST'])
+def add_session_files(session_id):
+    """Add roster files to an existing session (or replace them) and update its summary"""
+    try:
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # A running analysis job would save its state over the change
+        if job_queue.is_active(session_id):
+            return jsonify({'error': 'Session is still being analyzed, try again when its job is done'}), 409
+        
+        files, archives = read_uploaded_archives()
+        references = read_file_references()
+        
+        if references is None:
+            return jsonify({'error': 'Invalid manifest'}), 400
+        
+        missing = upload_store.missing_hashes(UPLOAD_FOLDER, [content_hash for _, content_hash in references])
+        if missing:
+            return jsonify({'error': 'Some files are not stored yet, upload them', 'missing': missing}), 409
+        
+        new_entries = store_request_files(files, references)
+        try:
+            if archives:
+                new_entries.update(store_archive_files(archives, session_dir))
+        except zip_stream.ZipStreamError as e:
+            return archive_error_response(e)
+        
+        if not new_entries:
+            return jsonify({'error': 'No valid .docx files uploaded'}), 400
+        
+        manifest = upload_store.session_manifest(session_dir)
+        for secure_name, entry in new_entries.items():
+            # A file of an older session, kept inside the session, is superseded by the stored one
+            old_entry = manifest.get(secure_name)
+            if old_entry is not None and not old_entry['hash']:
+                os.remove(os.path.join(session_dir, secure_name))
+            manifest[secure_name] = entry
+        upload_store.save_manifest(session_dir, manifest)
+        
+        state, changes = session_state.update_session(session_dir, added=list(new_entries),
+                                                      workers=app.config['PARSE_WORKERS'], backend=app.config['TABLE_BACKEND'])
+        
+        summary_data = session_state.session_summary(state)
+        result_cache.put_result(UPLOAD_FOLDER, result_cache.session_fingerprint(session_dir), summary_data,
+                                app.config['RESULT_CACHE_MAX_BYTES'])
+        
+        return compress_response(jsonify({
+            'success': True,
+            'session_dir': session_id,
+            'summary': summary_payload(summary_data),
+            **changes
+        }))
+        
+    except HTTPException:
+        raise  # e.g. 413 for a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({'error': f'Update failed: {str(e)}'}), 500
+
+@app.route('/sessions/<session_id>/summary')
+def session_filtered_summary(session_id):
+    """Heatmap summary of a session limited by date (from/to, YYYY-MM-DD), shift type and employee, without re-parsing"""
+    try:
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        try:
+            date_from, date_to = request_date_range()
+        except ValueError:
+            return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+        
+        state = session_state.indexed_session_state(session_dir, app.config['PARSE_WORKERS'], app.config['TABLE_BACKEND'])
+        summary_data = session_state.filtered_summary(state, date_from, date_to,
+                                                      request.args.getlist('shift_type'), request.args.getlist('employee'))
+        
+        return summary_response(summary_data, session_id)
+    
+    except Exception as e:
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
+
+@app.route('/sessions/<session_id>/files/remove', methods=['POST'])
+def remove_session_files(session_id):
+    """Remove roster files (by original or stored filename) from a session and update its summary"""
+    try:
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        if job_queue.is_active(session_id):
+            return jsonify({'error': 'Session is still being analyzed, try again when its job is done'}), 409
+        
+        filenames = set(request.form.getlist('filenames'))
+        
+        if not filenames:
+            return jsonify({'error': 'No filenames given'}), 400
+        
+        manifest = upload_store.session_manifest(session_dir)
+        removed = [secure_name for secure_name, entry in manifest.items()
+                   if secure_name in filenames or entry['original'] in filenames]
+        
+        if not removed:
+            return jsonify({'error': 'None of the files are in this session'}), 404
+        
+        for secure_name in removed:
+            # Stored files may be shared with other sessions; only files kept inside the session are deleted
+            if not manifest.pop(secure_name)['hash']:
+                os.remove(os.path.join(session_dir, secure_name))
+        upload_store.save_manifest(session_dir, manifest)
+        
+        state, changes = session_state.update_session(session_dir, removed=removed,
+                                                      workers=app.config['PARSE_WORKERS'], backend=app.config['TABLE_BACKEND'])
+        
+        summary_data = session_state.session_summary(state)
+        result_cache.put_result(UPLOAD_FOLDER, result_cache.session_fingerprint(session_dir), summary_data,
+                                app.config['RESULT_CACHE_MAX_BYTES'])
+        
+        return compress_response(jsonify({
+            'success': True,
+            'session_dir': session_id,
+            'summary': summary_payload(summary_data),
+            **changes
+        }))
+        
+    except HTTPException:
+        raise  # e.g. 413 for a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({'error': f'Update failed: {str(e)}'}), 500
+
+@app.route('/store/ingest', methods=['POST'])
+def ingest_session():
+    """Add the roster files of a session to the persistent shift store"""
+    try:
+        session_dir = get_session_dir(request.form.get('session_id'))
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        files = roster_engine.session_roster_files(session_dir)
+        ingested, skipped = shift_store.ingest_files(files, app.config['SHIFT_STORE_PATH'],
+                                                     roster_tables.session_cache_dir(session_dir),
+                                                     app.config['PARSE_WORKERS'], app.config['TABLE_BACKEND'],
+                                                     upload_store.session_file_hashes(session_dir))
+        
+        return jsonify({
+            'success': True,
+            'ingested': ingested,
+            'skipped': skipped
         })
         
     except Exception as e:
-        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+        return jsonify({'error': f'Ingest failed: {str(e)}'}), 500
+
+@app.route('/store/summary')
+def store_summary():
+    """Heatmap summary from the shift store, optionally limited by date (YYYY-MM-DD) and shift type"""
+    try:
+        try:
+            date_from, date_to = request_date_range()
+        except ValueError:
+            return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+        
+        summary = shift_store.shift_summary(app.config['SHIFT_STORE_PATH'], date_from, date_to,
+                                            request.args.getlist('shift_type'), request.args.getlist('employee'))
+        return jsonify({'success': True, 'summary': summary})
+    
+    except Exception as e:
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
+
+@app.route('/store/employees/<employee_name>/shifts')
+def store_employee_shifts(employee_name):
+    """Shifts of one employee from the shift store, as JSON or as a report file (?format=xlsx|csv|jsonl)"""
+    try:
+        export_format = request.args.get('format')
+        
+        if export_format and export_format not in extract_employee_shifts.EXPORT_FORMATS:
+            return jsonify({'error': f'Unknown format: {export_format}'}), 400
+        
+        try:
+            date_from, date_to = request_date_range()
+        except ValueError:
+            return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+        
+        shifts = shift_store.employee_shifts(employee_name, app.config['SHIFT_STORE_PATH'], date_from, date_to,
+                                             request.args.getlist('shift_type'))
+        
+        if not shifts:
+            return jsonify({'error': f'No shifts found for employee: {employee_name}'}), 404
+        
+        if not export_format:
+            return jsonify({'success': True, 'shifts': [shift.as_row() for shift in shifts]})
+        
+        output_name = extract_employee_shifts.report_filename(employee_name, export_format)
+        output_dir = tempfile.mkdtemp()
+        try:
+            output_path = os.path.join(output_dir, output_name)
+            extract_employee_shifts.write_shifts(shifts, output_path, export_format)
+            with open(output_path, 'rb') as f:
+                data = f.read()
+        finally:
+            shutil.rmtree(output_dir)
+        
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=output_name)
+    
+    except Exception as e:
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Generate individual employee report"""
+    with metrics.collect('upload') as request_metrics:
+        return run_profiled('upload', upload_request, request_metrics)
+
+def upload_request(request_metrics):
+    """Body of /upload, timed stage by stage"""
     try:
         employee_name = request.form.get('employee_name')
         session_id = request.form.get('session_id')
+        export_format = request.form.get('format', 'xlsx')
         
         if not employee_name or not session_id:
             return jsonify({'error': 'Missing employee name or session ID'}), 400
         
-        session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+        if export_format not in extract_employee_shifts.EXPORT_FORMATS:
+            return jsonify({'error': f'Unknown format: {export_format}'}), 400
         
-        if not os.path.exists(session_dir):
-            return jsonify({'error': 'Session not found'}), 404
+        session_dir = get_session_dir(session_id)
         
-        # Load filename mapping
-        mapping_file = os.path.join(session_dir, 'filename_mapping.txt')
-        filename_mapping = {}
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
         
-        if os.path.exists(mapping_file):
-            with open(mapping_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if ':' in line:
-                        temp_name, original_name = line.strip().split(':', 1)
-                        filename_mapping[temp_name] = original_name
-        else:
-            # If no mapping file, create one from current files
-            for secure_fname in os.listdir(session_dir):
-                if secure_fname.endswith('.docx'):
-                    filename_mapping[secure_fname] = secure_fname
+        profiling.attach(session_dir)
         
         # Extract shifts for the specific employee
-        shifts = extract_with_mapping(employee_name, session_dir, filename_mapping)
+        fingerprint, rows = cached_employee_shifts(employee_name, session_dir)
         
-        if not shifts:
+        if not rows:
             return jsonify({'error': f'No shifts found for employee: {employee_name}'}), 404
         
-        # Generate Excel file
-        output_file = os.path.join(session_dir, f'{employee_name}_shifts.xlsx')
-        extract_employee_shifts.write_to_xlsx(shifts, output_file)
+        # Generate the report file, unless the same one was made for the same files before
+        output_name = f'{employee_name}_shifts.{export_format}'
+        output_path = os.path.join(session_dir, output_name)
+        with metrics.stage('cache'):
+            cached_report = None if profiling.active() else result_cache.get_report(UPLOAD_FOLDER, fingerprint, employee_name, export_format)
         
-        return jsonify({
+        if cached_report is not None:
+            try:
+                with metrics.stage('write'):
+                    shutil.copyfile(cached_report, output_path)
+                metrics.count('report_cache_hits')
+            except OSError:
+                cached_report = None  # Evicted meanwhile, write it again from the shifts
+        
+        if cached_report is None:
+            with metrics.stage('write'):
+                extract_employee_shifts.write_shifts([Shift.from_row(row) for row in rows], output_path, export_format)
+            with metrics.stage('cache'):
+                result_cache.put_report(UPLOAD_FOLDER, fingerprint, employee_name, export_format, output_path,
+                                        app.config['REPORT_CACHE_MAX_BYTES'])
+        
+        response_data = {
             'success': True,
-            'message': f'Found {len(shifts)} shifts for {employee_name}',
-            'download_url': f'/download/{session_id}/{employee_name}_shifts.xlsx',
+            'message': f'Found {len(rows)} shifts for {employee_name}',
+            'download_url': f'/download/{session_id}/{output_name}',
             'session_dir': session_id
-        })
+        }
+        metrics_summary = debug_metrics(request_metrics)
+        if metrics_summary is not None:
+            response_data['metrics'] = metrics_summary
+        
+        with metrics.stage('serialize'):
+            return jsonify(response_data)
         
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
-def analyze_all_employees(session_dir, filename_mapping):
-    """Analyze all employees and return summary data for heatmap"""
-    employee_shifts = {}
-    all_employee_names = set()
+@app.route('/sessions/<session_id>/employees/<employee_name>/shifts')
+def session_employee_shifts(session_id, employee_name):
+    """Shifts of one employee in a session as JSON rows, without building a report file"""
+    try:
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        _, rows = cached_employee_shifts(employee_name, session_dir)
+        
+        if not rows:
+            return jsonify({'error': f'No shifts found for employee: {employee_name}'}), 404
+        
+        return compress_response(jsonify({'success': True, 'session_dir': session_id, 'employee': employee_name, 'shifts': rows}))
     
-    # First pass: Extract all possible employee names to build a comprehensive list
-    for secure_fname in os.listdir(session_dir):
-        if not secure_fname.endswith('.docx'):
-            continue
-            
-        filepath = os.path.join(session_dir, secure_fname)
-        original_filename = filename_mapping.get(secure_fname, secure_fname)
+    except Exception as e:
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
+
+@app.route('/upload_all', methods=['POST'])
+def upload_all_files():
+    """Generate the reports of every employee in a single pass over the session"""
+    try:
+        session_id = request.form.get('session_id')
+        layout = request.form.get('layout', 'zip')
+        export_format = request.form.get('format', 'xlsx')
         
-        try:
-            doc = Document(filepath)
-            
-            # Find the table and extract all possible names
-            for table in doc.tables:
-                for row in table.rows[1:]:  # Skip header
-                    shift_type = row.cells[0].text.strip()
-                    
-                    # Skip "Assenti" entries
-                    if 'assenti' in shift_type.lower():
-                        continue
-                    
-                    for cell in row.cells[1:]:
-                        cell_text = cell.text.strip()
-                        if cell_text and not cell_text.isspace():
-                            # Extract all possible names (both comma-separated and from parentheses)
-                            # First, get names separated by commas/newlines
-                            base_names = [name.strip() for name in cell_text.replace('\n', ',').split(',') if name.strip()]
-                            
-                            for base_name in base_names:
-                                # Remove non-name parentheses content (like shifts, numbers, etc.)
-                                # but preserve potential employee names
-                                clean_base = re.sub(r'\([^)]*(?:turno|shift|ore|h|:|\d+)[^)]*\)', '', base_name, flags=re.IGNORECASE)
-                                
-                                # Extract main name (before parentheses)
-                                main_name = re.sub(r'\([^)]*\)', '', clean_base).strip()
-                                if main_name and len(main_name) > 1 and not is_roman_numeral(main_name):
-                                    all_employee_names.add(main_name)
-                                
-                                # Extract potential names from parentheses
-                                parentheses_matches = re.findall(r'\(([^)]+)\)', clean_base)
-                                for match in parentheses_matches:
-                                    potential_name = match.strip()
-                                    # Check if it looks like a name (not a number, time, or shift info)
-                                    if (potential_name and 
-                                        len(potential_name) > 1 and 
-                                        not re.match(r'^[\d:.-]+$', potential_name) and
-                                        not re.search(r'\b(?:turno|shift|ore|h)\b', potential_name, re.IGNORECASE)):
-                                        all_employee_names.add(potential_name)
-        
-        except Exception as e:
-            print(f"Error in first pass processing {original_filename}: {e}")
-            continue
+        if not session_id:
+            return jsonify({'error': 'Missing session ID'}), 400
+        
+        if layout not in ('zip', 'sheets'):
+            return jsonify({'error': f'Unknown layout: {layout}'}), 400
+        
+        if export_format not in extract_employee_shifts.EXPORT_FORMATS:
+            return jsonify({'error': f'Unknown format: {export_format}'}), 400
+        
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        shifts_by_employee = extract_all_with_mapping(session_dir)
+        
+        if not shifts_by_employee:
+            return jsonify({'error': 'No shifts found for any employee'}), 404
+        
+        if layout == 'sheets':
+            output_name = f'all_employees_shifts.{export_format}'
+            output_path = os.path.join(session_dir, output_name)
+            if export_format == 'xlsx':
+                extract_employee_shifts.write_all_to_xlsx(shifts_by_employee, output_path)
+            else:
+                all_shifts = [row for rows in shifts_by_employee.values() for row in rows]
+                extract_employee_shifts.write_shifts(all_shifts, output_path, export_format)
+        else:
+            output_name = 'all_employees_shifts.zip'
+            extract_employee_shifts.write_all_to_zip(shifts_by_employee, os.path.join(session_dir, output_name), export_format)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Generated reports for {len(shifts_by_employee)} employees',
+            'download_url': f'/download/{session_id}/{output_name}',
+            'session_dir': session_id
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Report generation failed: {str(e)}'}), 500
+
+def summary_response(summary_data, session_id, request_metrics=None):
+    """Heatmap summary response with a content ETag; 304 without body if the client already has it.
     
-    print(f"Found {len(all_employee_names)} unique employee names: {sorted(all_employee_names)}")
+    request_metrics (see debug_metrics) are added to the body, and disable the 304.
+    """
+    summary_format = request.args.get('format', 'nested')
     
-    # Second pass: Extract shifts using the comprehensive name list
-    for secure_fname in os.listdir(session_dir):
-        if not secure_fname.endswith('.docx'):
-            continue
-            
-        filepath = os.path.join(session_dir, secure_fname)
-        original_filename = filename_mapping.get(secure_fname, secure_fname)
-        
-        try:
-            doc = Document(filepath)
-            
-            # Extract date range from ORIGINAL filename
-            start_day, start_month, end_day, end_month, start_year, end_year = extract_employee_shifts.extract_date_range_from_filename(original_filename)
-            if not all([start_day, start_month, end_day, end_month]):
-                continue
-            
-            # Find the table and extract all employees
-            for table in doc.tables:
-                headers = [cell.text.strip() for cell in table.rows[0].cells]
-                days = headers[1:]
+    if summary_format not in SUMMARY_FORMATS:
+        return jsonify({'error': f'Unknown summary format: {summary_format}'}), 400
+    
+    # Each format is its own representation, with its own ETag
+    etag = result_cache.summary_etag(summary_data)
+    if summary_format != 'nested':
+        etag = f'{etag}-{summary_format}'
+    
+    if request_metrics is None and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response_data = {
+            'success': True,
+            'session_dir': session_id,
+            'summary': summary_payload(summary_data)
+        }
+        if request_metrics is not None:
+            response_data['metrics'] = request_metrics
+        response = compress_response(jsonify(response_data))
+    
+    response.set_etag(etag)
+    # The client still needs the new session for reports when it reuses its own copy
+    response.headers['X-Session-Id'] = session_id
+    return response
+
+def summary_payload(summary_data):
+    """The summary in the format asked for with ?format= (nested {employee: {shift_type: count}} by default)"""
+    if request.args.get('format') == 'columnar':
+        return session_state.columnar_summary(summary_data)
+    return summary_data
+
+def compress_response(response):
+    """Compress a response body with brotli or gzip, whichever the client accepts (brotli first)"""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(response.get_data()))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def debug_metrics(request_metrics):
+    """Summary of the request's stage timers and counters if the client asked for it with debug=1, else None"""
+    if request.values.get('debug', '').lower() in ('1', 'true', 'yes'):
+        return request_metrics.summary()
+    return None
+
+def profiling_requested():
+    """Whether the current request should run through the profiler (see PROFILE_REQUESTS)"""
+    mode = app.config['PROFILE_REQUESTS']
+    if mode == 'always':
+        return True
+    return mode == 'header' and request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes')
+
+def run_profiled(endpoint, handler, *args):
+    """Run a request handler, through cProfile and tracemalloc if profiling is on for this request.
+    
+    The profile is saved under the session the handler attached, and its ID returned in X-Profile-Id.
+    """
+    if not profiling_requested():
+        return handler(*args)
+    
+    with profiling.profile(endpoint) as request_profile:
+        response = app.make_response(handler(*args))
+    
+    if request_profile is not None and request_profile.session_dir is not None:
+        response.headers['X-Profile-Id'] = profiling.save_profile(request_profile)
+    return response
+
+def parse_workers():
+    """Parsing processes for this request; profiled requests parse in-process so the profile sees the parsing"""
+    return 1 if profiling.active() else app.config['PARSE_WORKERS']
+
+def admin_denied():
+    """Error response for an admin request without the right X-Admin-Token, or None to go ahead.
+    Admin routes answer 404 while no ADMIN_TOKEN is configured."""
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), token.encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+def get_session_dir(session_id):
+    """Return the directory of an existing session, or None for unknown, reserved or unsafe IDs"""
+    if (not session_id or session_id in ('.', '..') or os.path.basename(session_id) != session_id
+            or upload_store.is_reserved(session_id)):
+        return None
+    session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+    if not os.path.isdir(session_dir):
+        return None
+    # Every request on a session keeps it alive for the reaper
+    session_reaper.touch_session(session_dir)
+    return session_dir
+
+def read_file_references():
+    """Parse the optional 'manifest' form field: a JSON list of {name, hash} for files
+    the client did not upload because the store already has them.
+
+    Returns a list of (original_filename, content_hash), or None if the field is invalid.
+    """
+    raw = request.form.get('manifest')
+    if not raw:
+        return []
+    try:
+        return [(str(entry['name']), str(entry['hash'])) for entry in json.loads(raw)]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+def request_date_range():
+    """The optional from/to query dates as YYYY-MM-DD (None when absent); raises ValueError for any other form"""
+    return format_date(parse_date(request.args.get('from'))), format_date(parse_date(request.args.get('to')))
+
+def read_uploaded_archives():
+    """Split the upload into (.docx files, .zip streams): the raw request body when it is a .zip
+    (Content-Type: application/zip), else the .zip files among the multipart 'files'"""
+    if request.mimetype in ZIP_MIMETYPES:
+        return [], [request.stream]
+    
+    files = []
+    archives = []
+    for file in request.files.getlist('files'):
+        if file.filename and file.filename.lower().endswith('.zip'):
+            archives.append(file.stream)
+        else:
+            files.append(file)
+    return files, archives
+
+def archive_error_response(error):
+    """Error response for an uploaded .zip that could not be read: 413 when over its limits, else 400"""
+    if isinstance(error, zip_stream.ZipTooLargeError):
+        return jsonify({'error': f'ZIP archive too large: {str(error)}'}), 413
+    return jsonify({'error': f'Invalid ZIP archive: {str(error)}'}), 400
+
+def store_archive_files(archives, session_dir):
+    """Put the rosters of uploaded .zip archives in the shared store one member at a time.
+    
+    Each roster starts being read into the shared grid cache as soon as it is
+    stored, so parsing overlaps with the rest of the upload and the analysis
+    finds its tables ready. Returns the manifest entries of the rosters.
+    """
+    cache_dir = roster_tables.session_cache_dir(session_dir)
+    backend = app.config['TABLE_BACKEND']
+    workers = roster_engine.resolve_workers(parse_workers(), os.cpu_count() or 1)
+    executor = roster_engine.parse_pool(parse_workers()) if workers > 1 else None
+    # One budget for the whole upload, so neither many archives nor many members get around it
+    budget = zip_stream.ArchiveBudget(MAX_ARCHIVE_BYTES, MAX_ARCHIVE_MEMBERS)
+    
+    entries = {}
+    pending = []
+    try:
+        for archive in archives:
+            for member_name, chunks in zip_stream.iter_zip_members(archive, MAX_CONTENT_LENGTH, budget):
+                # Original filenames (with their dates) are kept, without the folders of the archive
+                original_filename = member_name.rsplit('/', 1)[-1]
+                if member_name.startswith('__MACOSX/') or not extract_employee_shifts.is_roster_filename(original_filename):
+                    continue
                 
-                for row in table.rows[1:]:
-                    shift_type = row.cells[0].text.strip()
-                    
-                    # Skip "Assenti" entries
-                    if 'assenti' in shift_type.lower():
-                        continue
-                    
-                    for i, cell in enumerate(row.cells[1:]):
-                        cell_text = cell.text.strip()
-                        if cell_text and not cell_text.isspace():
-                            # Extract employee names using the comprehensive approach
-                            employee_names = extract_employee_names_from_cell(cell_text, all_employee_names)
-                            
-                            for employee_name in employee_names:
-                                if employee_name:
-                                    if employee_name not in employee_shifts:
-                                        employee_shifts[employee_name] = {}
-                                    
-                                    if shift_type not in employee_shifts[employee_name]:
-                                        employee_shifts[employee_name][shift_type] = 0
-                                    
-                                    employee_shifts[employee_name][shift_type] += 1
-                                    
-                                    # Add weekend shifts for "Guardia" on Friday
-                                    day_name = days[i] if i < len(days) else ''
-                                    if 'guardia' in shift_type.lower() and day_name.lower() == 'venerdì':
-                                        employee_shifts[employee_name][shift_type] += 2  # Saturday + Sunday
-        
-        except Exception as e:
-            print(f"Error processing {original_filename}: {e}")
-            continue
-    
-    return employee_shifts
-
-def is_roman_numeral(text):
-    """Check if text is a Roman numeral in parentheses that should be ignored"""
-    if not text:
-        return False
-    
-    # Remove parentheses if present
-    clean_text = text.strip('()')
-    
-    # Check if it's a Roman numeral (I, II, III, IV, V, VI, VII, VIII, IX, X, etc.)
-    roman_pattern = r'^(I{1,3}|IV|V|VI{0,3}|IX|X{1,3}|XL|L|LX{0,3}|XC|C{1,3}|CD|D|DC{0,3}|CM|M{1,3})$'
-    return bool(re.match(roman_pattern, clean_text.upper()))
-
-def extract_employee_names_from_cell(cell_text, known_names):
-    """Extract employee names from a cell, considering both comma-separated and parentheses formats"""
-    employee_names = []
-    
-    # Split by commas and newlines first
-    base_parts = [part.strip() for part in cell_text.replace('\n', ',').split(',') if part.strip()]
-    
-    for part in base_parts:
-        # Remove non-name parentheses content (shifts, times, etc.)
-        cleaned_part = re.sub(r'\([^)]*(?:turno|shift|ore|h|:|\d+)[^)]*\)', '', part, flags=re.IGNORECASE)
-        
-        # Extract main name (before any parentheses)
-        main_name = re.sub(r'\([^)]*\)', '', cleaned_part).strip()
-        if main_name and main_name in known_names:
-            employee_names.append(main_name)
-        
-        # Check parentheses for additional employee names
-        parentheses_matches = re.findall(r'\(([^)]+)\)', cleaned_part)
-        for match in parentheses_matches:
-            potential_name = match.strip()
-            
-            # Skip Roman numerals
-            if is_roman_numeral(potential_name):
-                continue
+                content_hash = upload_store.save_chunks_to_store(UPLOAD_FOLDER, chunks)
+                entries[secure_filename(original_filename)] = {'original': original_filename, 'hash': content_hash}
+                metrics.count('archive_files')
                 
-            if potential_name in known_names:
-                employee_names.append(potential_name)
-            else:
-                # Check if it's a partial match (like "Di Bella" matching "Di Bella")
-                for known_name in known_names:
-                    if (potential_name.lower() in known_name.lower() or 
-                        known_name.lower() in potential_name.lower()) and len(potential_name) > 2:
-                        employee_names.append(known_name)
-                        break
+                filepath = upload_store.store_path(UPLOAD_FOLDER, content_hash)
+                if executor is not None:
+                    try:
+                        pending.append((original_filename, executor.submit(roster_tables.load_tables, filepath, cache_dir, backend, content_hash)))
+                        continue
+                    except BrokenProcessPool:
+                        # Read the rest here; the next request gets a new pool
+                        roster_engine.discard_parse_pool(executor)
+                        executor = None
+                try:
+                    roster_tables.load_tables(filepath, cache_dir, backend, content_hash)
+                except Exception as e:
+                    print(f"Error reading {original_filename}: {e}")
+        
+        for original_filename, future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                # The analysis tries again and reports it
+                print(f"Error reading {original_filename}: {e}")
+    finally:
+        # The pool is shared: on error only drop the rosters not started yet
+        for _, future in pending:
+            future.cancel()
     
-    return list(set(employee_names))  # Remove duplicates
+    return entries
 
-def extract_with_mapping(employee_name, session_dir, filename_mapping):
-    """Extract shifts for specific employee using filename mapping"""
-    results = []
+def store_request_files(files, references=()):
+    """Put uploaded .docx files in the shared store and add the referenced ones.
+
+    Returns the manifest entries {secure_name: {'original', 'hash'}} of the valid files.
+    """
+    entries = {}
+    for file in files:
+        if file and file.filename and allowed_file(file.filename):
+            content_hash = upload_store.save_to_store(UPLOAD_FOLDER, file)
+            entries[secure_filename(file.filename)] = {'original': file.filename, 'hash': content_hash}
     
-    # First pass: Extract all employee names from all files
-    all_employee_names = set()
-    for secure_fname in os.listdir(session_dir):
-        if not secure_fname.endswith('.docx'):
-            continue
-            
-        filepath = os.path.join(session_dir, secure_fname)
-        
-        try:
-            doc = Document(filepath)
-            
-            # Find the table and extract all possible names
-            for table in doc.tables:
-                for row in table.rows[1:]:  # Skip header
-                    shift_type = row.cells[0].text.strip()
-                    
-                    # Skip "Assenti" entries
-                    if 'assenti' in shift_type.lower():
-                        continue
-                    
-                    for cell in row.cells[1:]:
-                        cell_text = cell.text.strip()
-                        if cell_text and not cell_text.isspace():
-                            # Simple extraction for building the name list
-                            base_names = [name.strip() for name in cell_text.replace('\n', ',').split(',') if name.strip()]
-                            
-                            for base_name in base_names:
-                                # Remove non-name parentheses content
-                                clean_base = re.sub(r'\([^)]*(?:turno|shift|ore|h|:|\d+)[^)]*\)', '', base_name, flags=re.IGNORECASE)
-                                
-                                # Extract main name
-                                main_name = re.sub(r'\([^)]*\)', '', clean_base).strip()
-                                if main_name and len(main_name) > 1 and not is_roman_numeral(main_name):
-                                    all_employee_names.add(main_name)
-                                
-                                # Extract potential names from parentheses
-                                parentheses_matches = re.findall(r'\(([^)]+)\)', clean_base)
-                                for match in parentheses_matches:
-                                    potential_name = match.strip()
-                                    
-                                    # Skip Roman numerals
-                                    if is_roman_numeral(potential_name):
-                                        continue
-                                        
-                                    if (potential_name and 
-                                        len(potential_name) > 1 and 
-                                        not re.match(r'^[\d:.-]+$', potential_name) and
-                                        not re.search(r'\b(?:turno|shift|ore|h)\b', potential_name, re.IGNORECASE)):
-                                        all_employee_names.add(potential_name)
-        
-        except Exception as e:
-            print(f"Error in name extraction for {secure_fname}: {e}")
-            continue
-    
-    # Second pass: Extract shifts for the specific employee
-    for secure_fname in os.listdir(session_dir):
-        if not secure_fname.endswith('.docx'):
-            continue
-            
-        filepath = os.path.join(session_dir, secure_fname)
-        original_filename = filename_mapping.get(secure_fname, secure_fname)
+    for original_filename, content_hash in references:
+        if allowed_file(original_filename) and upload_store.claim_file(UPLOAD_FOLDER, content_hash):
+            entries[secure_filename(original_filename)] = {'original': original_filename, 'hash': content_hash}
+    
+    return entries
+
+def save_uploaded_files(files, references=(), archives=()):
+    """Create a new session for uploaded and already stored .docx files, and the rosters of .zip archives.
+
+    Returns (session_dir, filename_mapping), or (None, None) if no file was valid.
+    """
+    manifest = store_request_files(files, references)
+    
+    # Create a temporary directory for this analysis; its manifest points into the store
+    session_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER)
+    try:
+        if archives:
+            manifest.update(store_archive_files(archives, session_dir))
+    except BaseException:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        raise
+    
+    if not manifest:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return None, None
+    
+    upload_store.save_manifest(session_dir, manifest)
+    
+    filename_mapping = {secure_name: entry['original'] for secure_name, entry in manifest.items()}
+    return session_dir, filename_mapping
+
+def analyze_all_employees(session_dir, progress=None):
+    """Analyze all employees and return summary data for heatmap"""
+    # The same files (by content and original name) always give the same summary
+    with metrics.stage('cache'):
+        fingerprint = result_cache.session_fingerprint(session_dir)
+        # A profiled analysis always runs, or there would be nothing to profile
+        summary_data = None if profiling.active() else result_cache.get_result(UPLOAD_FOLDER, fingerprint)
+    if summary_data is not None:
+        metrics.count('result_cache_hits')
+        print(f"Reusing cached analysis {fingerprint}")
+        if progress is not None:
+            for _, _, original_filename in upload_store.session_files(session_dir):
+                progress(original_filename)
+        return summary_data
+    
+    # Keep the per-file results so files can be added or removed later
+    state = session_state.analyze_session(session_dir, parse_workers(), app.config['TABLE_BACKEND'], progress)
+    all_employee_names = session_state.known_names(state)
+    print(f"Found {len(all_employee_names)} unique employee names: {sorted(all_employee_names)}")
+    summary_data = session_state.session_summary(state)
+    with metrics.stage('cache'):
+        result_cache.put_result(UPLOAD_FOLDER, fingerprint, summary_data, app.config['RESULT_CACHE_MAX_BYTES'])
+    return summary_data
+
+def analyze_job(session_dir, progress, profiled=False):
+    """Body of a background analysis job, with its own metrics (and profile if it was requested)"""
+    with metrics.collect('analyze_job'):
+        if not profiled:
+            return analyze_all_employees(session_dir, progress)
         
-        try:
-            doc = Document(filepath)
-            
-            # Extract date range from ORIGINAL filename
-            start_day, start_month, end_day, end_month, start_year, end_year = extract_employee_shifts.extract_date_range_from_filename(original_filename)
-            if not all([start_day, start_month, end_day, end_month]):
-                continue
-                
-            # Get actual dates for this week
-            week_dates = extract_employee_shifts.get_week_dates_from_range(start_day, start_month, end_day, end_month, start_year, end_year)
-            
-            # Find the table
-            for table in doc.tables:
-                headers = [cell.text.strip() for cell in table.rows[0].cells]
-                days = headers[1:]
-                
-                for row in table.rows[1:]:
-                    shift_type = row.cells[0].text.strip()
-                    
-                    for i, cell in enumerate(row.cells[1:]):
-                        cell_text = cell.text.strip()
-                        if cell_text and not cell_text.isspace():
-                            # Extract all possible names using the enhanced method
-                            employee_names = extract_employee_names_from_cell(cell_text, all_employee_names)
-                            
-                            # Check if our target employee is in this cell
-                            if employee_name in employee_names:
-                                if 'assenti' in shift_type.lower():
-                                    continue
-                                    
-                                day_name = days[i] if i < len(days) else f'Day{i+1}'
-                                date_str = week_dates[i] if i < len(week_dates) else ''
-                                
-                                results.append({
-                                    'File': original_filename,
-                                    'Data': date_str,
-                                    'Giorno': day_name,
-                                    'Turno': shift_type,
-                                    'Dipendente': employee_name
-                                })
-                                
-                                # Add weekend shifts for "Guardia" on Friday
-                                if 'guardia' in shift_type.lower() and day_name.lower() == 'venerdì':
-                                    # Add Saturday
-                                    saturday_date = extract_employee_shifts.add_days_to_date(date_str, 1) if date_str else ''
-                                    results.append({
-                                        'File': original_filename,
-                                        'Data': saturday_date,
-                                        'Giorno': 'Sabato',
-                                        'Turno': shift_type,
-                                        'Dipendente': employee_name
-                                    })
-                                    
-                                    # Add Sunday
-                                    sunday_date = extract_employee_shifts.add_days_to_date(date_str, 2) if date_str else ''
-                                    results.append({
-                                        'File': original_filename,
-                                        'Data': sunday_date,
-                                        'Giorno': 'Domenica',
-                                        'Turno': shift_type,
-                                        'Dipendente': employee_name
-                                    })
-        
-        except Exception as e:
-            print(f"Error processing {original_filename}: {e}")
-            continue
+        with profiling.profile('analyze_job') as request_profile:
+            summary_data = analyze_all_employees(session_dir, progress)
+        if request_profile is not None:
+            request_profile.session_dir = session_dir
+            profiling.save_profile(request_profile)
+        return summary_data
+
+def extract_with_mapping(employee_name, session_dir):
+    """Extract shifts for specific employee using filename mapping"""
+    with metrics.stage('parse'):
+        all_employee_names, records = roster_engine.collect_cell_records(session_dir, parse_workers(), app.config['TABLE_BACKEND'])
+    
+    with metrics.stage('names'):
+        name_index = roster_engine.NameIndex(all_employee_names)
+    metrics.count('names', len(all_employee_names))
+    
+    with metrics.stage('match'):
+        results = []
+        for record in records:
+            # Check if our target employee is in this cell
+            if employee_name in roster_engine.resolve_cell_names(record['text'], name_index):
+                results.extend(roster_engine.shift_rows_for_record(record, employee_name))
+    metrics.count('shifts', len(results))
     
     return results
 
+def cached_employee_shifts(employee_name, session_dir):
+    """Return (session fingerprint, shift rows) of one employee, extracted once per batch of files"""
+    with metrics.stage('cache'):
+        fingerprint = result_cache.session_fingerprint(session_dir)
+        # Like the summaries, a profiled request always extracts
+        rows = None if profiling.active() else result_cache.get_report_shifts(UPLOAD_FOLDER, fingerprint, employee_name)
+    if rows is not None:
+        metrics.count('shift_cache_hits')
+        return fingerprint, rows
+    
+    rows = [shift.as_row() for shift in extract_with_mapping(employee_name, session_dir)]
+    if rows:
+        with metrics.stage('cache'):
+            result_cache.put_report_shifts(UPLOAD_FOLDER, fingerprint, employee_name, rows, app.config['REPORT_CACHE_MAX_BYTES'])
+    return fingerprint, rows
+
+def extract_all_with_mapping(session_dir):
+    """Extract the shifts of every employee in one traversal of the session"""
+    all_employee_names, records = roster_engine.collect_cell_records(session_dir, app.config['PARSE_WORKERS'], app.config['TABLE_BACKEND'])
+    return roster_engine.extract_all_employee_shifts(records, all_employee_names)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings and counters of /analyze and /upload, in the Prometheus text format"""
+    return app.response_class(metrics.render_prometheus(roster_engine.cache_stats()),
+                              mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/sessions/<session_id>/profiles')
+def session_profiles(session_id):
+    """List the saved request profiles of a session"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    
+    session_dir = get_session_dir(session_id)
+    
+    if session_dir is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'profiles': profiling.list_profiles(session_dir)
+    })
+
+@app.route('/admin/sessions/<session_id>/profiles/<filename>')
+def download_profile(session_id, filename):
+    """Download a saved profile: <id>.prof (pstats format) or <id>.json (top functions and allocation sites)"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    
+    session_dir = get_session_dir(session_id)
+    profile_path = profiling.profile_path(session_dir, filename) if session_dir else None
+    
+    if profile_path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(profile_path, as_attachment=True, download_name=filename)
+
+@app.route('/reaper/stats')
+def reaper_stats():
+    """Sessions and bytes reclaimed so far, plus the current usage of the upload folder"""
+    return jsonify(reaper.stats())
+
+@app.route('/reaper/run', methods=['POST'])
+def run_reaper():
+    """Run a reaping pass now instead of waiting for the next interval"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    
+    try:
+        return jsonify({'success': True, **reaper.run_once()})
+    except Exception as e:
+        return jsonify({'error': f'Reaping failed: {str(e)}'}), 500
+
 @app.route('/download/<session_id>/<filename>')
 def download_file(session_id, filename):
     try:
-        session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+        session_dir = get_session_dir(session_id)
+        
+        if session_dir is None or os.path.basename(filename) != filename:
+            return jsonify({'error': 'File not found'}), 404
+        
         file_path = os.path.join(session_dir, filename)
         
         if not os.path.exists(file_path):
@@ -455,8 +979,9 @@ def download_file(session_id, filename):
 @app.route('/cleanup/<session_id>', methods=['POST'])
 def cleanup_session(session_id):
     try:
-        session_dir = os.path.join(UPLOAD_FOLDER, session_id)
-        if os.path.exists(session_dir):
+        # Stored roster files are shared and stay; only the session itself goes
+        session_dir = get_session_dir(session_id)
+        if session_dir is not None:
             shutil.rmtree(session_dir)
         return jsonify({'success': True})
     except Exception as e:
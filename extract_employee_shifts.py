@@ -1,13 +1,26 @@
+import argparse
+import csv
+import io
+import json
 import os
 import re
 import sys
-from docx import Document
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import groupby, zip_longest
+from operator import attrgetter
 from openpyxl import Workbook
 from datetime import datetime, timedelta
+from shift_model import Shift, by_date, format_date
 
 # Folder containing the .docx files
 TURNI_FOLDER = 'turni'
 OUTPUT_XLSX = 'employee_shifts.xlsx'
+OUTPUT_ALL_XLSX = 'all_employee_shifts.xlsx'
+OUTPUT_ALL_ZIP = 'all_employee_shifts.zip'
+OUTPUT_DIR = 'employee_reports'  # One report per employee when several are extracted
 
 # Helper to extract date range from filename (e.g., '57. 25/11/24 - 29/11/24.docx' or '59. 09:12:24 - 13:12:24.docx' or '55. 11:11 - 15:11.docx')
 def extract_date_range_from_filename(filename):
@@ -55,7 +68,7 @@ def get_year_for_month(month):
         return 2025
 
 # Helper to get week dates from the date range
-def get_week_dates_from_range(start_day, start_month, end_day, end_month, start_year=None, end_year=None):
+def get_week_date_objects_from_range(start_day, start_month, end_day, end_month, start_year=None, end_year=None):
     # Use provided years if available, otherwise use the old logic
     if start_year is None:
         start_year = get_year_for_month(start_month)
@@ -72,11 +85,15 @@ def get_week_dates_from_range(start_day, start_month, end_day, end_month, start_
     while current_date <= end_date:
         # Only include weekdays (Monday=0 to Friday=4)
         if current_date.weekday() < 5:
-            week_dates.append(current_date.strftime('%Y-%m-%d'))
+            week_dates.append(current_date.date())
         current_date += timedelta(days=1)
     
     return week_dates
 
+def get_week_dates_from_range(start_day, start_month, end_day, end_month, start_year=None, end_year=None):
+    return [week_date.strftime('%Y-%m-%d') for week_date in
+            get_week_date_objects_from_range(start_day, start_month, end_day, end_month, start_year, end_year)]
+
 def add_days_to_date(date_str, days):
     """Add days to a date string and return the new date string"""
     if not date_str:
@@ -89,149 +106,390 @@ def add_days_to_date(date_str, days):
         return ''
 
 # Helper to get all docx files in the folder
+def is_roster_filename(filename):
+    if not filename.endswith('.docx') or filename.startswith('~$'):  # Skip temporary Word files
+        return False
+    # Skip files that start with pattern like "90_." (number + underscore + dot)
+    return not re.match(r'^\d+_\.', filename)
+
 def get_docx_files(folder):
-    files = []
-    for f in os.listdir(folder):
-        if f.endswith('.docx') and not f.startswith('~$'):  # Skip temporary Word files
-            # Skip files that start with pattern like "90_." (number + underscore + dot)
-            if re.match(r'^\d+_\.', f):
-                continue
-            files.append(os.path.join(folder, f))
-    return files
+    return [os.path.join(folder, f) for f in os.listdir(folder) if is_roster_filename(f)]
+
+def collect_turni_records(workers=None, backend=None, use_cache=True):
+    """Parse the turni folder into (candidate names, cell records).
+
+    With use_cache only new or changed files (by mtime and size, then hash)
+    are parsed; the others come from the grid cache kept in the folder.
+    """
+    import roster_engine
+    import roster_tables
+    
+    filepaths = get_docx_files(TURNI_FOLDER)
+    files = [(filepath, os.path.basename(filepath)) for filepath in filepaths]
+    
+    if not use_cache:
+        # Parse all roster files (in parallel across CPU cores) into cell records
+        return roster_engine.collect_file_records(files, workers=workers, backend=backend)
+    
+    hashes, changed = roster_tables.refresh_folder_manifest(TURNI_FOLDER, filepaths)
+    print(f"{len(changed)} of {len(files)} roster files new or changed")
+    # Cached grids load faster than worker processes start
+    return roster_engine.collect_file_records(files, roster_tables.folder_cache_dir(TURNI_FOLDER),
+                                              workers if changed else 1, backend, hashes=hashes)
 
 # Main extraction logic
-def extract_employee_shifts(employee_name):
-    results = []
+def extract_employee_shifts(employee_name, workers=None, backend=None, use_cache=True):
+    return extract_employees_shifts([employee_name], workers, backend, use_cache)[employee_name]
+
+def extract_employees_shifts(employee_names, workers=None, backend=None, use_cache=True):
+    """Shifts of several employees (name or part of it, as in the tables) from a single parse of the folder"""
+    results = {employee_name: [] for employee_name in employee_names}
+    searches = [(employee_name, employee_name.lower()) for employee_name in results]
     
-    for filepath in get_docx_files(TURNI_FOLDER):
-        doc = Document(filepath)
-        filename = os.path.basename(filepath)
-        
-        # Extract date range from filename
-        start_day, start_month, end_day, end_month, start_year, end_year = extract_date_range_from_filename(filename)
-        if not all([start_day, start_month, end_day, end_month]):
-            continue
-            
-        # Get actual dates for this week
-        week_dates = get_week_dates_from_range(start_day, start_month, end_day, end_month, start_year, end_year)
-        
-        # Find the table
-        for table in doc.tables:
-            # Assume first column is shift type, first row is days
-            headers = [cell.text.strip() for cell in table.rows[0].cells]
-            days = headers[1:]  # skip first column (type)
-            
-            for row in table.rows[1:]:
-                shift_type = row.cells[0].text.strip()
+    _, records = collect_turni_records(workers, backend, use_cache)
+    
+    for record in records:
+        cell_text = record['text'].lower()
+        for employee_name, search in searches:
+            if search in cell_text:
+                shift = Shift(record['file'], record['date'], record['day'], record['shift_type'])
+                results[employee_name].append(shift)
                 
-                for i, cell in enumerate(row.cells[1:]):
-                    cell_text = cell.text.strip().lower()
-                    if employee_name.lower() in cell_text:
-                        # Skip "Assenti" entries
-                        if 'assenti' in shift_type.lower():
-                            continue
-                            
-                        # Get the day name and corresponding date
-                        day_name = days[i] if i < len(days) else f'Day{i+1}'
-                        date_str = week_dates[i] if i < len(week_dates) else ''
-                        
-                        results.append({
-                            'File': filename,
-                            'Data': date_str,
-                            'Giorno': day_name,
-                            'Turno': shift_type
-                        })
-                        
-                        # If it's "Guardia" on Friday, add Saturday and Sunday too
-                        if 'guardia' in shift_type.lower() and day_name.lower() == 'venerdì':
-                            # Add Saturday
-                            if date_str:
-                                saturday_date = datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)
-                                results.append({
-                                    'File': filename,
-                                    'Data': saturday_date.strftime('%Y-%m-%d'),
-                                    'Giorno': 'Sabato',
-                                    'Turno': shift_type
-                                })
-                                
-                                # Add Sunday
-                                sunday_date = datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=2)
-                                results.append({
-                                    'File': filename,
-                                    'Data': sunday_date.strftime('%Y-%m-%d'),
-                                    'Giorno': 'Domenica',
-                                    'Turno': shift_type
-                                })
+                # If it's "Guardia" on Friday, add Saturday and Sunday too
+                if 'guardia' in shift.shift_type.lower() and shift.day.lower() == 'venerdì':
+                    if shift.date is not None:
+                        results[employee_name].append(shift.shifted(1, 'Sabato'))
+                        results[employee_name].append(shift.shifted(2, 'Domenica'))
     
     return results
 
-def write_to_xlsx(data, output_path):
-    from collections import Counter
+def extract_all_employee_shifts(workers=None, backend=None, use_cache=True):
+    """Shifts of every employee found in the turni folder, from a single parse of the folder"""
+    import roster_engine
     
+    all_employee_names, records = collect_turni_records(workers, backend, use_cache)
+    return roster_engine.extract_all_employee_shifts(records, all_employee_names)
+
+# Helper to detect changes in the turni folder without reading any file
+def folder_snapshot(folder):
+    snapshot = {}
+    for filepath in get_docx_files(folder):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue  # Removed meanwhile
+        snapshot[filepath] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+# Helper to run the callback of a watch, so one failed run does not stop the watching
+def run_watch_callback(callback):
+    try:
+        callback()
+    except Exception as e:
+        print(f"Regenerating reports failed: {e}")
+
+def watch_folder(folder, callback, interval=10):
+    """Call callback now and again whenever the .docx files of the folder change.
+
+    A change is only acted on once the folder has been stable for one
+    interval, so files still being copied are not parsed half-written.
+    A failing callback is logged and tried again on the next change.
+    """
+    run_watch_callback(callback)
+    last_run = folder_snapshot(folder)
+    last_seen = last_run
+    print(f"Watching {folder} for roster changes (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(interval)
+            snapshot = folder_snapshot(folder)
+            if snapshot != last_seen:
+                last_seen = snapshot
+                continue
+            if snapshot != last_run:
+                print("Roster files changed, regenerating reports")
+                run_watch_callback(callback)
+                last_run = snapshot
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+def write_to_xlsx(data, output_path):
     # Sort data by date (oldest to newest)
-    sorted_data = sorted(data, key=lambda x: x['Data'])
+    sorted_data = sorted(data, key=by_date)
     
-    wb = Workbook()
+    # Write-only workbook: rows are streamed to the file instead of kept as cells
+    wb = Workbook(write_only=True)
     
     # Sheet 1: All shifts (sorted by date)
-    ws1 = wb.active
-    ws1.title = 'Tutti i Turni'
-    headers = ['File', 'Data', 'Giorno', 'Turno']
-    ws1.append(headers)
-    for row in sorted_data:
-        ws1.append([row[h] for h in headers])
+    ws1 = wb.create_sheet(title='Tutti i Turni')
+    ws1.append(['File', 'Data', 'Giorno', 'Turno'])
+    for shift in sorted_data:
+        ws1.append([shift.file, format_date(shift.date), shift.day, shift.shift_type])
+    
+    # Group by shift type with a single sort: (type, date) order gives both the
+    # count per type and its unique sorted dates
+    shift_counts = []
+    dates_by_type = []
+    for shift_type, shifts in groupby(sorted(sorted_data, key=attrgetter('shift_type')), key=attrgetter('shift_type')):
+        dates = [format_date(shift.date) for shift in shifts]
+        shift_counts.append([shift_type, len(dates)])
+        dates_by_type.append([date for date, _ in groupby(dates)])
     
     # Sheet 2: Summary count by shift type
     ws2 = wb.create_sheet(title='Riepilogo per Turno')
-    shift_counts = Counter(row['Turno'] for row in sorted_data)
     ws2.append(['Tipo di Turno', 'Numero di Volte'])
-    for shift_type, count in sorted(shift_counts.items()):
-        ws2.append([shift_type, count])
+    for row in shift_counts:
+        ws2.append(row)
     
-    # Sheet 3: Dates grouped by shift type (horizontal layout)
+    # Sheet 3: Dates grouped by shift type (horizontal layout), written row by row
     ws3 = wb.create_sheet(title='Date per Turno')
+    if shift_counts:
+        ws3.append([shift_type for shift_type, _ in shift_counts])
+    for dates in zip_longest(*dates_by_type):
+        ws3.append(list(dates))
     
-    # Group data by shift type
-    shifts_by_type = {}
-    for row in sorted_data:
-        shift_type = row['Turno']
-        if shift_type not in shifts_by_type:
-            shifts_by_type[shift_type] = []
-        shifts_by_type[shift_type].append(row['Data'])
-    
-    # Sort shift types and get unique sorted dates for each
-    sorted_shift_types = sorted(shifts_by_type.keys())
-    for shift_type in sorted_shift_types:
-        shifts_by_type[shift_type] = sorted(list(set(shifts_by_type[shift_type])))
-    
-    # Write headers (shift types)
-    for col, shift_type in enumerate(sorted_shift_types, 1):
-        ws3.cell(row=1, column=col, value=shift_type)
-    
-    # Write dates under each shift type column
-    for col, shift_type in enumerate(sorted_shift_types, 1):
-        dates = shifts_by_type[shift_type]
-        for row, date in enumerate(dates, 2):  # Start from row 2
-            ws3.cell(row=row, column=col, value=date)
+    wb.save(output_path)
+
+# Columns of the flat (CSV / JSON lines) exports
+EXPORT_HEADERS = ['File', 'Data', 'Giorno', 'Turno', 'Dipendente']
+
+# Helper to write text to either a path or an already open binary file (e.g. a zip member)
+@contextmanager
+def open_text_output(output):
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            yield f
+    else:
+        wrapper = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        try:
+            yield wrapper
+        finally:
+            wrapper.flush()
+            wrapper.detach()
+
+def write_to_csv(data, output_path):
+    """Stream the shifts, sorted by date, as CSV rows"""
+    sorted_data = sorted(data, key=by_date)
+    with_employee = not sorted_data or sorted_data[0].employee is not None
+    headers = EXPORT_HEADERS if with_employee else EXPORT_HEADERS[:-1]
+    
+    with open_text_output(output_path) as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for shift in sorted_data:
+            row = [shift.file, format_date(shift.date), shift.day, shift.shift_type]
+            if with_employee:
+                row.append(shift.employee or '')
+            writer.writerow(row)
+
+def write_to_jsonl(data, output_path):
+    """Stream the shifts, sorted by date, as one JSON object per line"""
+    with open_text_output(output_path) as f:
+        for shift in sorted(data, key=by_date):
+            f.write(json.dumps(shift.as_row(), ensure_ascii=False))
+            f.write('\n')
+
+# Report writers by output format
+EXPORT_FORMATS = {
+    'xlsx': write_to_xlsx,
+    'csv': write_to_csv,
+    'jsonl': write_to_jsonl
+}
+
+def write_shifts(data, output_path, fmt='xlsx'):
+    """Write the shifts report in the given format (xlsx, csv or jsonl)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    EXPORT_FORMATS[fmt](data, output_path)
+
+# Helper to build a report filename that is safe inside folders and zip archives
+def report_filename(employee_name, fmt='xlsx'):
+    return re.sub(r'[\\/:*?"<>|]', '_', employee_name) + f'_shifts.{fmt}'
+
+# Helper to make a unique, valid worksheet title (max 31 chars, no []:*?/\)
+def sheet_title(name, used_titles):
+    base = re.sub(r'[\[\]:*?/\\]', '_', name)[:31] or 'Sheet'
+    title = base
+    counter = 2
+    while title.lower() in used_titles:
+        suffix = f' ({counter})'
+        title = base[:31 - len(suffix)] + suffix
+        counter += 1
+    used_titles.add(title.lower())
+    return title
+
+def write_all_to_xlsx(shifts_by_employee, output_path):
+    """One workbook with a summary sheet and a sheet per employee listing their shifts"""
+    wb = Workbook(write_only=True)
+    
+    # Summary sheet: shift counts per employee and shift type
+    ws = wb.create_sheet(title='Riepilogo')
+    shift_types = sorted({shift.shift_type for shifts in shifts_by_employee.values() for shift in shifts})
+    ws.append(['Dipendente'] + shift_types + ['Totale'])
+    for employee_name in sorted(shifts_by_employee):
+        counts = {}
+        for shift in shifts_by_employee[employee_name]:
+            counts[shift.shift_type] = counts.get(shift.shift_type, 0) + 1
+        ws.append([employee_name] + [counts.get(shift_type, 0) for shift_type in shift_types] + [sum(counts.values())])
+    
+    # One sheet per employee with all shifts sorted by date
+    used_titles = {ws.title.lower()}
+    for employee_name in sorted(shifts_by_employee):
+        ws = wb.create_sheet(title=sheet_title(employee_name, used_titles))
+        ws.append(['File', 'Data', 'Giorno', 'Turno'])
+        for shift in sorted(shifts_by_employee[employee_name], key=by_date):
+            ws.append([shift.file, format_date(shift.date), shift.day, shift.shift_type])
     
     wb.save(output_path)
 
+def write_reports(shifts_by_employee, output_dir, fmt='xlsx', jobs=1):
+    """Write one report per employee into output_dir, with up to jobs processes (0 = one per CPU core).
+
+    Returns the written paths, in employee order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    reports = [(shifts_by_employee[employee_name], os.path.join(output_dir, report_filename(employee_name, fmt)))
+               for employee_name in sorted(shifts_by_employee)]
+    
+    jobs = min(jobs or os.cpu_count() or 1, len(reports))
+    if jobs <= 1:
+        for shifts, output_path in reports:
+            write_shifts(shifts, output_path, fmt)
+    else:
+        # Workbook writing is CPU bound, so it is spread over processes
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(write_shifts, shifts, output_path, fmt) for shifts, output_path in reports]
+            for future in futures:
+                future.result()
+    
+    return [output_path for _, output_path in reports]
+
+# Helper to read employee names from a file: one per line, blank lines and # comments skipped
+def read_names_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def write_all_to_zip(shifts_by_employee, output_path, fmt='xlsx'):
+    """A zip archive holding one report (three-sheet workbook, CSV or JSON lines) per employee"""
+    if fmt == 'xlsx':
+        # Workbooks are already compressed, so they are stored as they are
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as zf:
+            for employee_name in sorted(shifts_by_employee):
+                buffer = io.BytesIO()
+                write_to_xlsx(shifts_by_employee[employee_name], buffer)
+                zf.writestr(report_filename(employee_name), buffer.getvalue())
+        return
+    
+    # Text formats are streamed straight into the compressed archive
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for employee_name in sorted(shifts_by_employee):
+            with zf.open(report_filename(employee_name, fmt), 'w') as member:
+                write_shifts(shifts_by_employee[employee_name], member, fmt)
+
 if __name__ == '__main__':
-    # Check if employee name is provided as command line argument
-    if len(sys.argv) != 2:
-        print("Usage: python extract_employee_shifts.py <employee_name>")
-        print("Example: python extract_employee_shifts.py 'John Doe'")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description='Extract the shifts of employees from the .docx files in the turni folder',
+        epilog="Examples: python extract_employee_shifts.py 'John Doe' | "
+               "python extract_employee_shifts.py Rossi Bianchi --jobs 4 | "
+               "python extract_employee_shifts.py --names-file names.txt --output-dir reports")
+    parser.add_argument('employee_names', nargs='*', metavar='employee_name',
+                        help='name (or part of it) to search in the shift tables; several names write one report each')
+    parser.add_argument('--names-file', help='file with one employee name per line')
+    parser.add_argument('--all', action='store_true',
+                        help='write the reports of every employee found in the tables')
+    parser.add_argument('--layout', choices=['zip', 'sheets'], default='zip',
+                        help='with --all and no --output-dir: a zip with one report per employee, or a single file '
+                             '(one sheet per employee for xlsx, one combined table for csv/jsonl)')
+    parser.add_argument('--output-dir',
+                        help=f'write one report per employee into this folder (default for several names: {OUTPUT_DIR})')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='xlsx',
+                        help='report format (default: xlsx)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='parsing processes to use (default: one per CPU core)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='processes writing the per-employee reports (default: 1, 0 = one per CPU core)')
+    parser.add_argument('--backend', choices=['python-docx', 'stream'], default=None,
+                        help='table reader: python-docx, or the faster streaming XML reader')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help=f'parse every file again instead of reusing the grids cached in {TURNI_FOLDER}/.roster_cache')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and regenerate the reports whenever a roster file is added or changed')
+    parser.add_argument('--interval', type=float, default=10,
+                        help='with --watch: seconds between checks of the folder (default: 10)')
+    args = parser.parse_args()
     
-    employee_name = sys.argv[1]
-    print(f"Extracting shifts for: {employee_name}")
+    employee_names = list(args.employee_names)
+    if args.names_file:
+        employee_names.extend(read_names_file(args.names_file))
+    # Keep the first occurrence of repeated names
+    employee_names = list(dict.fromkeys(employee_names))
     
-    shifts = extract_employee_shifts(employee_name)
+    if args.all and employee_names:
+        parser.error('give either employee names or --all, not both')
     
-    if not shifts:
-        print(f"No shifts found for employee: {employee_name}")
-        print("Please check the employee name spelling and try again.")
-        sys.exit(1)
+    if not args.all and not employee_names:
+        parser.error('an employee name is required unless --names-file or --all is given')
+    
+    def generate_reports():
+        """Run the extraction once; returns the exit status"""
+        if args.all:
+            print("Extracting shifts for all employees")
+            shifts_by_employee = extract_all_employee_shifts(args.workers, args.backend, args.use_cache)
+            
+            if not shifts_by_employee:
+                print("No employees found in the shift tables.")
+                return 1
+            
+            if args.output_dir:
+                paths = write_reports(shifts_by_employee, args.output_dir, args.format, args.jobs)
+                print(f'Saved reports for {len(paths)} employees to {args.output_dir}')
+                return 0
+            
+            if args.layout == 'sheets':
+                output_path = os.path.splitext(OUTPUT_ALL_XLSX)[0] + f'.{args.format}'
+                if args.format == 'xlsx':
+                    write_all_to_xlsx(shifts_by_employee, output_path)
+                else:
+                    write_shifts([shift for shifts in shifts_by_employee.values() for shift in shifts], output_path, args.format)
+            else:
+                output_path = OUTPUT_ALL_ZIP
+                write_all_to_zip(shifts_by_employee, output_path, args.format)
+            print(f'Saved reports for {len(shifts_by_employee)} employees to {output_path}')
+            return 0
+        
+        if len(employee_names) > 1 or args.names_file or args.output_dir:
+            print(f"Extracting shifts for {len(employee_names)} employees")
+            shifts_by_employee = extract_employees_shifts(employee_names, args.workers, args.backend, args.use_cache)
+            
+            for employee_name in employee_names:
+                if not shifts_by_employee[employee_name]:
+                    print(f"No shifts found for employee: {employee_name}")
+                    del shifts_by_employee[employee_name]
+            
+            if not shifts_by_employee:
+                return 1
+            
+            output_dir = args.output_dir or OUTPUT_DIR
+            paths = write_reports(shifts_by_employee, output_dir, args.format, args.jobs)
+            print(f'Saved reports for {len(paths)} employees to {output_dir}')
+            return 0
+        
+        employee_name = employee_names[0]
+        print(f"Extracting shifts for: {employee_name}")
+        
+        shifts = extract_employee_shifts(employee_name, args.workers, args.backend, args.use_cache)
+        
+        if not shifts:
+            print(f"No shifts found for employee: {employee_name}")
+            print("Please check the employee name spelling and try again.")
+            return 1
+        
+        output_path = os.path.splitext(OUTPUT_XLSX)[0] + f'.{args.format}'
+        write_shifts(shifts, output_path, args.format)
+        print(f'Saved {len(shifts)} shifts for {employee_name} to {output_path}')
+        return 0
     
-    write_to_xlsx(shifts, OUTPUT_XLSX)
-    print(f'Saved {len(shifts)} shifts for {employee_name} to {OUTPUT_XLSX}')
+    if args.watch:
+        watch_folder(TURNI_FOLDER, generate_reports, args.interval)
+    else:
+        sys.exit(generate_reports())
@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the per-file parse time histogram
+PARSE_SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Metrics of the request being handled on this thread (none outside collect())
+_local = threading.local()
+
+# Totals since the process started, per endpoint
+_lock = threading.Lock()
+_requests = {}  # endpoint: [count, seconds]
+_stages = {}  # (endpoint, stage): [count, seconds]
+_counters = {}  # (endpoint, name): total
+_parse_buckets = [0] * len(PARSE_SECONDS_BUCKETS)
+_parse_totals = [0, 0.0]  # count, seconds
+
+class RequestMetrics:
+    """Stage timers and counters of one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.stages = {}
+        self.counters = {}
+        self.files = []
+
+    def add_stage(self, name, seconds):
+        # A stage run several times (e.g. once per file) adds up
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def file_parsed(self, filename, seconds, tables, cells):
+        self.files.append({'file': filename, 'seconds': round(seconds, 6), 'tables': tables, 'cells': cells})
+        self.count('files')
+        self.count('tables', tables)
+        self.count('cells', cells)
+
+    def summary(self):
+        """JSON-friendly summary, for responses of requests made with the debug flag"""
+        return {
+            'endpoint': self.endpoint,
+            'seconds': round(self.seconds if self.seconds is not None else time.perf_counter() - self.started, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+            'files': list(self.files)
+        }
+
+def current():
+    """Metrics of the request handled on this thread, or None"""
+    return getattr(_local, 'metrics', None)
+
+@contextmanager
+def collect(endpoint):
+    """Collect the metrics of one request on this thread; they join the totals when it ends"""
+    previous = current()
+    request_metrics = RequestMetrics(endpoint)
+    _local.metrics = request_metrics
+    try:
+        yield request_metrics
+    finally:
+        _local.metrics = previous
+        request_metrics.seconds = time.perf_counter() - request_metrics.started
+        record(request_metrics)
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current request (no-op outside collect())"""
+    request_metrics = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if request_metrics is not None:
+            request_metrics.add_stage(name, time.perf_counter() - start)
+
+def count(name, value=1):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.count(name, value)
+
+def file_parsed(filename, seconds, tables, cells):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.file_parsed(filename, seconds, tables, cells)
+
+def record(request_metrics):
+    """Add a finished request to the process totals"""
+    endpoint = request_metrics.endpoint
+    with _lock:
+        totals = _requests.setdefault(endpoint, [0, 0.0])
+        totals[0] += 1
+        totals[1] += request_metrics.seconds
+        for name, seconds in request_metrics.stages.items():
+            totals = _stages.setdefault((endpoint, name), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        for name, value in request_metrics.counters.items():
+            _counters[(endpoint, name)] = _counters.get((endpoint, name), 0) + value
+        for entry in request_metrics.files:
+            _parse_totals[0] += 1
+            _parse_totals[1] += entry['seconds']
+            for i, bound in enumerate(PARSE_SECONDS_BUCKETS):
+                if entry['seconds'] <= bound:
+                    _parse_buckets[i] += 1
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _stages.clear()
+        _counters.clear()
+        _parse_buckets[:] = [0] * len(PARSE_SECONDS_BUCKETS)
+        _parse_totals[:] = [0, 0.0]
+
+# Helper to format Prometheus label values
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def render_prometheus(cache_stats=None):
+    """Totals in the Prometheus text exposition format; cache_stats as returned by roster_engine.cache_stats()"""
+    lines = []
+    with _lock:
+        lines.append('# HELP roster_requests_total Instrumented requests handled')
+        lines.append('# TYPE roster_requests_total counter')
+        for endpoint, (requests, _) in sorted(_requests.items()):
+            lines.append(f'roster_requests_total{_labels(endpoint=endpoint)} {requests}')
+
+        lines.append('# HELP roster_request_seconds Time spent handling instrumented requests')
+        lines.append('# TYPE roster_request_seconds summary')
+        for endpoint, (requests, seconds) in sorted(_requests.items()):
+            lines.append(f'roster_request_seconds_sum{_labels(endpoint=endpoint)} {seconds:.6f}')
+            lines.append(f'roster_request_seconds_count{_labels(endpoint=endpoint)} {requests}')
+
+        lines.append('# HELP roster_stage_seconds Time spent per request stage')
+        lines.append('# TYPE roster_stage_seconds summary')
+        for (endpoint, name), (requests, seconds) in sorted(_stages.items()):
+            lines.append(f'roster_stage_seconds_sum{_labels(endpoint=endpoint, stage=name)} {seconds:.6f}')
+            lines.append(f'roster_stage_seconds_count{_labels(endpoint=endpoint, stage=name)} {requests}')
+
+        lines.append('# HELP roster_items_total Files, tables, cells, names and shifts processed')
+        lines.append('# TYPE roster_items_total counter')
+        for (endpoint, name), value in sorted(_counters.items()):
+            lines.append(f'roster_items_total{_labels(endpoint=endpoint, item=name)} {value}')
+
+        lines.append('# HELP roster_file_parse_seconds Time to load and parse one roster file')
+        lines.append('# TYPE roster_file_parse_seconds histogram')
+        for bound, value in zip(PARSE_SECONDS_BUCKETS, _parse_buckets):
+            lines.append(f'roster_file_parse_seconds_bucket{_labels(le=bound)} {value}')
+        lines.append(f'roster_file_parse_seconds_bucket{_labels(le="+Inf")} {_parse_totals[0]}')
+        lines.append(f'roster_file_parse_seconds_sum {_parse_totals[1]:.6f}')
+        lines.append(f'roster_file_parse_seconds_count {_parse_totals[0]}')
+
+    if cache_stats:
+        lines.append('# HELP roster_cell_cache_hits_total Hits of the cell parsing memos')
+        lines.append('# TYPE roster_cell_cache_hits_total counter')
+        for cache, stats in sorted(cache_stats.items()):
+            lines.append(f"roster_cell_cache_hits_total{_labels(cache=cache)} {stats['hits']}")
+        lines.append('# HELP roster_cell_cache_misses_total Misses of the cell parsing memos')
+        lines.append('# TYPE roster_cell_cache_misses_total counter')
+        for cache, stats in sorted(cache_stats.items()):
+            lines.append(f"roster_cell_cache_misses_total{_labels(cache=cache)} {stats['misses']}")
+        lines.append('# HELP roster_cell_cache_entries Entries held by the cell parsing memos')
+        lines.append('# TYPE roster_cell_cache_entries gauge')
+        for cache, stats in sorted(cache_stats.items()):
+            lines.append(f"roster_cell_cache_entries{_labels(cache=cache)} {stats['size']}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,165 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Profiles of a session are kept in its directory, so they go when the session does
+PROFILE_DIR = 'profiles'
+# Functions (by cumulative time) and allocation sites kept in the JSON summary
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Stack depth recorded for each allocation
+TRACEMALLOC_FRAMES = 1
+
+PROFILE_FILE_RE = re.compile(r'^[\w-]+\.(?:prof|json)$')
+
+# One profile at a time: cProfile cannot nest and tracemalloc sees every thread
+_profile_lock = threading.Lock()
+_local = threading.local()
+
+class RequestProfile:
+    """cProfile and tracemalloc results of one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.created = time.time()
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+        self.peak_bytes = None
+        self.seconds = None
+        # Set by the request once it knows its session (see attach)
+        self.session_dir = None
+
+def current():
+    """Profile of the request handled on this thread, or None"""
+    return getattr(_local, 'profile', None)
+
+def active():
+    return current() is not None
+
+def attach(session_dir):
+    """Tell the current profile (if any) which session directory to save into"""
+    request_profile = current()
+    if request_profile is not None:
+        request_profile.session_dir = session_dir
+
+@contextmanager
+def profile(endpoint):
+    """Run the block through cProfile and tracemalloc.
+
+    Yields the RequestProfile, or None (and the block runs unprofiled) while
+    another request is being profiled.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        print(f"Profiling skipped for {endpoint}: another request is being profiled")
+        yield None
+        return
+
+    request_profile = RequestProfile(endpoint)
+    # Leave tracemalloc running if it was started outside (e.g. PYTHONTRACEMALLOC)
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        if was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _local.profile = request_profile
+        start = time.perf_counter()
+        request_profile.profiler.enable()
+        try:
+            yield request_profile
+        finally:
+            request_profile.profiler.disable()
+            request_profile.seconds = time.perf_counter() - start
+            _local.profile = None
+            request_profile.peak_bytes = tracemalloc.get_traced_memory()[1]
+            request_profile.snapshot = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+
+def profile_dir(session_dir):
+    return os.path.join(session_dir, PROFILE_DIR)
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    """The functions with the most cumulative time"""
+    stats = pstats.Stats(profiler).stats
+    functions = []
+    for (filename, lineno, name), (primitive_calls, calls, total, cumulative, _) in stats.items():
+        functions.append({
+            'function': f'{filename}:{lineno}({name})',
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'total_seconds': round(total, 6),
+            'cumulative_seconds': round(cumulative, 6)
+        })
+    functions.sort(key=lambda function: function['cumulative_seconds'], reverse=True)
+    return functions[:limit]
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    """The source lines holding the most memory still allocated at the end of the request"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')
+    ])
+    return [{
+        'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'size_bytes': stat.size,
+        'count': stat.count
+    } for stat in snapshot.statistics('lineno')[:limit]]
+
+def save_profile(request_profile):
+    """Save a finished profile under its session: <id>.prof for pstats/snakeviz, <id>.json with the top entries.
+
+    Returns the profile ID.
+    """
+    folder = profile_dir(request_profile.session_dir)
+    os.makedirs(folder, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(request_profile.created))}-{request_profile.endpoint}-{os.urandom(3).hex()}"
+
+    request_profile.profiler.dump_stats(os.path.join(folder, f'{profile_id}.prof'))
+    with open(os.path.join(folder, f'{profile_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'id': profile_id,
+            'endpoint': request_profile.endpoint,
+            'created': request_profile.created,
+            'seconds': round(request_profile.seconds, 6),
+            'peak_traced_bytes': request_profile.peak_bytes,
+            'functions': top_functions(request_profile.profiler),
+            'allocations': top_allocations(request_profile.snapshot)
+        }, f, ensure_ascii=False, indent=1)
+
+    print(f"Saved profile {profile_id} of {request_profile.endpoint} ({request_profile.seconds:.3f}s)")
+    return profile_id
+
+def list_profiles(session_dir):
+    """Return the id, endpoint, creation time and duration of the profiles of a session, oldest first"""
+    folder = profile_dir(session_dir)
+    if not os.path.isdir(folder):
+        return []
+
+    profiles = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: saved.get(key) for key in ('id', 'endpoint', 'created', 'seconds', 'peak_traced_bytes')})
+    return profiles
+
+def profile_path(session_dir, filename):
+    """Path of a saved profile file, or None for unknown or unsafe names"""
+    if not PROFILE_FILE_RE.match(filename):
+        return None
+    path = os.path.abspath(os.path.join(profile_dir(session_dir), filename))
+    return path if os.path.exists(path) else None
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import roster_tables
+import upload_store
+
+# Summaries of analyzed batches, shared by all sessions (reserved folder of the upload folder)
+RESULT_CACHE_DIR = '_results'
+# Bump when the analysis changes so stale summaries are not reused
+RESULT_CACHE_VERSION = 1
+
+# Shifts and report files of one employee in an analyzed batch, a folder per (batch, employee)
+REPORT_CACHE_DIR = '_reports'
+REPORT_SHIFTS_FILE = 'shifts.json'
+
+def batch_fingerprint(files):
+    """Fingerprint of a batch of (content_hash, original_filename) pairs.
+
+    Original filenames are part of it because the dates come from them.
+    """
+    key = json.dumps([RESULT_CACHE_VERSION, sorted(files)], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def session_fingerprint(session_dir):
+    files = []
+    for secure_name, entry in upload_store.session_manifest(session_dir).items():
+        # Files of older sessions have no recorded hash
+        content_hash = entry['hash'] or roster_tables.file_sha256(upload_store.entry_path(session_dir, secure_name, entry))
+        files.append((content_hash, entry['original']))
+    return batch_fingerprint(files)
+
+def summary_etag(summary):
+    """Content ETag of a heatmap summary, the same whichever endpoint returns it"""
+    return hashlib.sha256(json.dumps(summary, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def cache_dir(upload_folder):
+    return os.path.join(upload_folder, RESULT_CACHE_DIR)
+
+def get_result(upload_folder, fingerprint):
+    """Return the cached summary of a batch, or None; a hit counts as a use for the LRU order"""
+    path = os.path.join(cache_dir(upload_folder), f'{fingerprint}.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        os.utime(path)
+        return summary
+    except (OSError, ValueError):
+        return None
+
+def put_result(upload_folder, fingerprint, summary, max_bytes):
+    """Cache the summary of a batch, then evict the least recently used ones above max_bytes"""
+    folder = cache_dir(upload_folder)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{fingerprint}.json')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    evict(upload_folder, max_bytes)
+
+def evict(upload_folder, max_bytes):
+    """Remove the least recently used summaries until the cache fits in max_bytes"""
+    entries = []
+    total = 0
+    with os.scandir(cache_dir(upload_folder)) as it:
+        for entry in it:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Evicted by another request meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def report_cache_dir(upload_folder):
+    return os.path.join(upload_folder, REPORT_CACHE_DIR)
+
+def report_entry_dir(upload_folder, fingerprint, employee_name):
+    key = json.dumps([RESULT_CACHE_VERSION, fingerprint, employee_name], ensure_ascii=False)
+    return os.path.join(report_cache_dir(upload_folder), hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+def get_report_shifts(upload_folder, fingerprint, employee_name):
+    """Return the cached shift rows (Shift.as_row()) of an employee in a batch, or None"""
+    entry_dir = report_entry_dir(upload_folder, fingerprint, employee_name)
+    try:
+        with open(os.path.join(entry_dir, REPORT_SHIFTS_FILE), 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        os.utime(entry_dir)
+        return rows
+    except (OSError, ValueError):
+        return None
+
+def put_report_shifts(upload_folder, fingerprint, employee_name, rows, max_bytes):
+    """Cache the shift rows of an employee in a batch, then evict the least recently used employees above max_bytes"""
+    entry_dir = report_entry_dir(upload_folder, fingerprint, employee_name)
+    os.makedirs(entry_dir, exist_ok=True)
+    path = os.path.join(entry_dir, REPORT_SHIFTS_FILE)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    evict_reports(upload_folder, max_bytes)
+
+def get_report(upload_folder, fingerprint, employee_name, export_format):
+    """Path of the cached report file of an employee in a batch, or None"""
+    entry_dir = report_entry_dir(upload_folder, fingerprint, employee_name)
+    path = os.path.join(entry_dir, f'report.{export_format}')
+    if not os.path.exists(path):
+        return None
+    try:
+        os.utime(entry_dir)
+    except OSError:
+        return None  # Evicted meanwhile
+    return path
+
+def put_report(upload_folder, fingerprint, employee_name, export_format, report_path, max_bytes):
+    """Cache a copy of a generated report; the employee's shifts must have been cached first"""
+    entry_dir = report_entry_dir(upload_folder, fingerprint, employee_name)
+    os.makedirs(entry_dir, exist_ok=True)
+    path = os.path.join(entry_dir, f'report.{export_format}')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    shutil.copyfile(report_path, tmp_path)
+    os.replace(tmp_path, path)
+    evict_reports(upload_folder, max_bytes)
+
+def evict_reports(upload_folder, max_bytes):
+    """Remove the cached reports of the least recently used employees until the cache fits in max_bytes"""
+    entries = []
+    total = 0
+    with os.scandir(report_cache_dir(upload_folder)) as it:
+        for entry in it:
+            size = 0
+            try:
+                mtime = entry.stat().st_mtime
+                with os.scandir(entry.path) as files:
+                    for file in files:
+                        size += file.stat().st_size
+            except OSError:
+                continue  # Evicted by another request meanwhile
+            entries.append((mtime, size, entry.path))
+            total += size
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,508 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+import extract_employee_shifts
+import metrics
+import roster_tables
+import upload_store
+from shift_model import Shift, format_date
+
+# Parentheses holding shifts, times or numbers rather than names
+NON_NAME_PARENS_RE = re.compile(r'\([^)]*(?:turno|shift|ore|h|:|\d+)[^)]*\)', re.IGNORECASE)
+PARENS_RE = re.compile(r'\([^)]*\)')
+PARENS_CONTENT_RE = re.compile(r'\(([^)]+)\)')
+ROMAN_NUMERAL_RE = re.compile(r'^(I{1,3}|IV|V|VI{0,3}|IX|X{1,3}|XL|L|LX{0,3}|XC|C{1,3}|CD|D|DC{0,3}|CM|M{1,3})$')
+NUMERIC_RE = re.compile(r'^[\d:.-]+$')
+SHIFT_WORD_RE = re.compile(r'\b(?:turno|shift|ore|h)\b', re.IGNORECASE)
+
+# Maximum number of distinct cell texts remembered by each parsing memo
+CELL_CACHE_SIZE = 50000
+
+# Parsing process pools shared by every request, by number of processes
+_parse_pools = {}
+_parse_pools_lock = threading.Lock()
+
+class LRUCache:
+    """Small thread-safe LRU mapping with hit/miss counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None, updating the counters"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+# Candidate names per cell text (independent of the known names)
+CELL_CANDIDATES_CACHE = LRUCache(CELL_CACHE_SIZE)
+# Resolved employee names per (cell text, known-names version)
+CELL_NAMES_CACHE = LRUCache(CELL_CACHE_SIZE)
+
+def is_roman_numeral(text):
+    """Check if text is a Roman numeral in parentheses that should be ignored"""
+    if not text:
+        return False
+
+    # Remove parentheses if present
+    clean_text = text.strip('()')
+
+    # Check if it's a Roman numeral (I, II, III, IV, V, VI, VII, VIII, IX, X, etc.)
+    return bool(ROMAN_NUMERAL_RE.match(clean_text.upper()))
+
+def split_cell_parts(cell_text):
+    """Split a cell by commas/newlines and drop non-name parentheses (shifts, times, etc.)"""
+    parts = []
+    for part in cell_text.replace('\n', ',').split(','):
+        part = part.strip()
+        if part:
+            parts.append(NON_NAME_PARENS_RE.sub('', part))
+    return parts
+
+def looks_like_name(potential_name):
+    """Check if a parenthetical looks like a name (not a number, time, or shift info)"""
+    return bool(potential_name and
+                len(potential_name) > 1 and
+                not NUMERIC_RE.match(potential_name) and
+                not SHIFT_WORD_RE.search(potential_name))
+
+def candidate_names_from_parts(parts):
+    """Return every string of the cell parts that looks like an employee name"""
+    names = []
+
+    for part in parts:
+        # Extract main name (before parentheses)
+        main_name = PARENS_RE.sub('', part).strip()
+        if main_name and len(main_name) > 1 and not is_roman_numeral(main_name):
+            names.append(main_name)
+
+        # Extract potential names from parentheses
+        parentheses_matches = PARENS_CONTENT_RE.findall(part)
+        for match in parentheses_matches:
+            potential_name = match.strip()
+
+            # Skip Roman numerals
+            if is_roman_numeral(potential_name):
+                continue
+
+            if looks_like_name(potential_name):
+                names.append(potential_name)
+
+    return names
+
+def cell_candidate_names(cell_text):
+    """Memoized candidate_names_from_parts for a raw cell text"""
+    names = CELL_CANDIDATES_CACHE.get(cell_text)
+    if names is None:
+        names = tuple(candidate_names_from_parts(split_cell_parts(cell_text)))
+        CELL_CANDIDATES_CACHE.put(cell_text, names)
+    return names
+
+class NameIndex:
+    """Lookup structure over the known employee names of a session.
+
+    Exact hits use a set. Partial hits (a parenthetical contained in a known
+    name, or containing one, ignoring case) go through a trigram index instead
+    of scanning every name; ties resolve to the alphabetically first name.
+    """
+
+    def __init__(self, known_names):
+        self.names = frozenset(known_names)
+        # Stable across processes and requests, so memoized results can be shared
+        self.version = hashlib.sha1('\n'.join(sorted(self.names)).encode('utf-8')).hexdigest()
+        self._by_lower = {}
+        self._trigrams = {}
+        for name in sorted(self.names):
+            lower_name = name.lower()
+            self._by_lower.setdefault(lower_name, []).append(name)
+            for i in range(len(lower_name) - 2):
+                self._trigrams.setdefault(lower_name[i:i + 3], set()).add(lower_name)
+        self._lengths = sorted({len(lower_name) for lower_name in self._by_lower})
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def partial_match(self, potential_name):
+        """Return the known name matching potential_name partially, or None"""
+        if len(potential_name) <= 2:
+            return None
+        lower_potential = potential_name.lower()
+        matches = set()
+
+        # Known names containing the potential name share all of its trigrams
+        postings = [self._trigrams.get(lower_potential[i:i + 3], set()) for i in range(len(lower_potential) - 2)]
+        if postings:
+            postings.sort(key=len)
+            matches.update(lower_name for lower_name in postings[0].intersection(*postings[1:])
+                           if lower_potential in lower_name)
+
+        # Known names contained in the potential name are among its substrings
+        for length in self._lengths:
+            if length > len(lower_potential):
+                break
+            for i in range(len(lower_potential) - length + 1):
+                if lower_potential[i:i + length] in self._by_lower:
+                    matches.add(lower_potential[i:i + length])
+
+        if not matches:
+            return None
+        return min(self._by_lower[lower_name][0] for lower_name in matches)
+
+# Helper to accept either a prepared NameIndex or a plain collection of names
+def as_name_index(known_names):
+    if isinstance(known_names, NameIndex):
+        return known_names
+    return NameIndex(known_names)
+
+def names_from_parts(parts, known_names):
+    """Resolve the employee names of already split cell parts against the known names"""
+    name_index = as_name_index(known_names)
+    employee_names = []
+
+    for part in parts:
+        # Extract main name (before any parentheses)
+        main_name = PARENS_RE.sub('', part).strip()
+        if main_name and main_name in name_index:
+            employee_names.append(main_name)
+
+        # Check parentheses for additional employee names
+        parentheses_matches = PARENS_CONTENT_RE.findall(part)
+        for match in parentheses_matches:
+            potential_name = match.strip()
+
+            # Skip Roman numerals
+            if is_roman_numeral(potential_name):
+                continue
+
+            if potential_name in name_index:
+                employee_names.append(potential_name)
+            else:
+                # Check if it's a partial match (like "Di Bella" matching "Di Bella")
+                known_name = name_index.partial_match(potential_name)
+                if known_name is not None:
+                    employee_names.append(known_name)
+
+    return list(set(employee_names))  # Remove duplicates
+
+def needs_partial_lookup(cell_text):
+    """Check if the names of a cell depend on which other names are known.
+
+    Main names and name-like parentheticals are candidates themselves, so they
+    always resolve exactly; only the remaining parentheticals go through the
+    partial match, whose result changes with the known-name set.
+    """
+    for part in split_cell_parts(cell_text):
+        for match in PARENS_CONTENT_RE.findall(part):
+            potential_name = match.strip()
+            if len(potential_name) > 2 and not is_roman_numeral(potential_name) and not looks_like_name(potential_name):
+                return True
+    return False
+
+def resolve_cell_names(cell_text, known_names):
+    """Memoized employee names of a raw cell text, keyed by (cell text, known-names version)"""
+    name_index = as_name_index(known_names)
+    key = (cell_text, name_index.version)
+    names = CELL_NAMES_CACHE.get(key)
+    if names is None:
+        names = tuple(names_from_parts(split_cell_parts(cell_text), name_index))
+        CELL_NAMES_CACHE.put(key, names)
+    return names
+
+def extract_employee_names_from_cell(cell_text, known_names):
+    """Extract employee names from a cell, considering both comma-separated and parentheses formats"""
+    return list(resolve_cell_names(cell_text, known_names))
+
+def cache_stats():
+    """Return hit/miss counters of the cell parsing memos"""
+    return {
+        'cell_candidates': CELL_CANDIDATES_CACHE.stats(),
+        'cell_names': CELL_NAMES_CACHE.stats()
+    }
+
+def parse_roster_file(filepath, original_filename, cache_dir=None, backend=None, content_hash=None):
+    """Parse one roster file into its candidate names and cell records.
+
+    Undated files still contribute names but produce no records. This runs
+    inside the worker processes, so it only takes and returns plain data.
+    """
+    tables = roster_tables.load_tables(filepath, cache_dir, backend, content_hash)
+    return parse_tables(tables, original_filename)
+
+def parse_tables(tables, original_filename):
+    """Candidate names and cell records of the table grids of one roster file"""
+    # Extract date range from ORIGINAL filename
+    start_day, start_month, end_day, end_month, start_year, end_year = extract_employee_shifts.extract_date_range_from_filename(original_filename)
+    week_dates = None
+    if all([start_day, start_month, end_day, end_month]):
+        week_dates = extract_employee_shifts.get_week_date_objects_from_range(start_day, start_month, end_day, end_month, start_year, end_year)
+
+    file_names = set()
+    file_records = []
+    for table in tables:
+        days = table[0][1:] if table else []
+
+        for row in table[1:]:
+            shift_type = row[0]
+
+            # Skip "Assenti" entries
+            if 'assenti' in shift_type.lower():
+                continue
+
+            for i, cell_text in enumerate(row[1:]):
+                if cell_text and not cell_text.isspace():
+                    file_names.update(cell_candidate_names(cell_text))
+
+                    if week_dates is not None:
+                        file_records.append({
+                            'file': original_filename,
+                            'date': week_dates[i] if i < len(week_dates) else None,
+                            'day': days[i] if i < len(days) else f'Day{i+1}',
+                            'shift_type': shift_type,
+                            'text': cell_text
+                        })
+
+    return file_names, file_records
+
+def timed_parse_roster_file(filepath, original_filename, cache_dir=None, backend=None, content_hash=None):
+    """parse_roster_file plus (seconds, tables, non-empty cells), reported to the metrics by the calling process"""
+    start = time.perf_counter()
+    tables = roster_tables.load_tables(filepath, cache_dir, backend, content_hash)
+    result = parse_tables(tables, original_filename)
+    cells = sum(1 for table in tables for row in table[1:] for cell_text in row[1:] if cell_text.strip())
+    return result, (time.perf_counter() - start, len(tables), cells)
+
+# Helper to pick the number of parsing processes (0/None means one per CPU core)
+def resolve_workers(workers, file_count):
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, file_count))
+
+def parse_pool(workers=None):
+    """Return the long-lived pool of parsing processes of this size (0/None means one per CPU core).
+
+    Its processes come from a fork server (or are spawned where there is
+    none) rather than being forked from a threaded server, and are kept
+    between requests instead of starting a pool for each one.
+    """
+    workers = workers or os.cpu_count() or 1
+    with _parse_pools_lock:
+        pool = _parse_pools.get(workers)
+        if pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _parse_pools[workers] = pool
+        return pool
+
+def discard_parse_pool(pool):
+    """Drop a pool that broke (e.g. a process was killed), so the next parse_pool call starts a new one"""
+    with _parse_pools_lock:
+        for workers, current in list(_parse_pools.items()):
+            if current is pool:
+                del _parse_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@atexit.register
+def shutdown_parse_pools():
+    with _parse_pools_lock:
+        pools = list(_parse_pools.values())
+        _parse_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def iter_parsed_files(files, cache_dir=None, workers=None, backend=None, hashes=None):
+    """Parse (filepath, original_filename) pairs, yielding (original_filename, result, error) in input order.
+
+    hashes optionally maps filepaths to their known content hash (see roster_tables.load_tables).
+    """
+    hashes = hashes or {}
+
+    if resolve_workers(workers, len(files)) == 1:
+        for filepath, original_filename in files:
+            try:
+                result, stats = timed_parse_roster_file(filepath, original_filename, cache_dir, backend, hashes.get(filepath))
+            except Exception as e:
+                yield original_filename, None, e
+                continue
+            metrics.file_parsed(original_filename, *stats)
+            yield original_filename, result, None
+        return
+
+    # Helper to queue every file on a pool
+    def submit_all(pool):
+        return [pool.submit(timed_parse_roster_file, filepath, original_filename, cache_dir, backend, hashes.get(filepath))
+                for filepath, original_filename in files]
+
+    pool = parse_pool(workers)
+    try:
+        futures = submit_all(pool)
+    except BrokenProcessPool:
+        # Broke while idle: start over on a new pool
+        discard_parse_pool(pool)
+        pool = parse_pool(workers)
+        futures = submit_all(pool)
+
+    try:
+        for (filepath, original_filename), future in zip(files, futures):
+            try:
+                result, stats = future.result()
+            except BrokenProcessPool as e:
+                # A parsing process died and took the queued files with it; the next call gets a new pool
+                discard_parse_pool(pool)
+                yield original_filename, None, e
+                continue
+            except Exception as e:
+                yield original_filename, None, e
+                continue
+            metrics.file_parsed(original_filename, *stats)
+            yield original_filename, result, None
+    finally:
+        # If the consumer stops early (e.g. a cancelled job) drop the files not started yet
+        for future in futures:
+            future.cancel()
+
+def collect_file_records(files, cache_dir=None, workers=None, backend=None, progress=None, hashes=None):
+    """Parse the given files and merge their names and cell records.
+
+    A file that fails to parse is logged and skipped. If given, progress is
+    called as progress(original_filename, error) after each file; an exception
+    raised by it stops the parsing.
+    """
+    all_employee_names = set()
+    records = []
+
+    for original_filename, result, error in iter_parsed_files(files, cache_dir, workers, backend, hashes):
+        if progress is not None:
+            progress(original_filename, error)
+
+        if error is not None:
+            print(f"Error processing {original_filename}: {error}")
+            continue
+
+        file_names, file_records = result
+        all_employee_names.update(file_names)
+        records.extend(file_records)
+
+    return all_employee_names, records
+
+def session_roster_files(session_dir):
+    """Return (filepath, original_filename) pairs of the roster files of a session"""
+    return [(filepath, original_filename) for _, filepath, original_filename in upload_store.session_files(session_dir)]
+
+def collect_cell_records(session_dir, workers=None, backend=None, progress=None):
+    """Walk every table of the session once.
+
+    Returns the set of candidate employee names together with one record per
+    non-empty cell of the dated files, so name resolution and counting can run
+    over the in-memory records without touching the documents again.
+    """
+    return collect_file_records(session_roster_files(session_dir), roster_tables.session_cache_dir(session_dir),
+                                workers, backend, progress, upload_store.session_file_hashes(session_dir))
+
+def count_employee_shifts(records, known_names):
+    """Count shifts per employee and shift type over the collected cell records"""
+    employee_shifts = {}
+    name_index = as_name_index(known_names)
+
+    for record in records:
+        shift_type = record['shift_type']
+        # Friday "Guardia" also covers Saturday and Sunday
+        weekend = 'guardia' in shift_type.lower() and record['day'].lower() == 'venerdì'
+
+        for employee_name in resolve_cell_names(record['text'], name_index):
+            if employee_name not in employee_shifts:
+                employee_shifts[employee_name] = {}
+
+            if shift_type not in employee_shifts[employee_name]:
+                employee_shifts[employee_name][shift_type] = 0
+
+            employee_shifts[employee_name][shift_type] += 3 if weekend else 1
+
+    return employee_shifts
+
+def count_employee_shifts_by_date(records, known_names):
+    """Count shifts per date, employee and shift type: {YYYY-MM-DD: {employee: {shift_type: count}}}.
+
+    Like the report rows, a Friday "Guardia" counts once on Friday, Saturday
+    and Sunday. Cells beyond the dates of their week are counted under ''.
+    """
+    date_counts = {}
+    name_index = as_name_index(known_names)
+
+    for record in records:
+        employee_names = resolve_cell_names(record['text'], name_index)
+        if not employee_names:
+            continue
+
+        shift_type = record['shift_type']
+        weekend = 'guardia' in shift_type.lower() and record['day'].lower() == 'venerdì'
+        if record['date'] is None:
+            dates = [('', 3 if weekend else 1)]
+        else:
+            dates = [(format_date(record['date'] + timedelta(days=offset)), 1) for offset in range(3 if weekend else 1)]
+
+        for date_key, weight in dates:
+            day_counts = date_counts.setdefault(date_key, {})
+            for employee_name in employee_names:
+                employee_counts = day_counts.setdefault(employee_name, {})
+                employee_counts[shift_type] = employee_counts.get(shift_type, 0) + weight
+
+    return date_counts
+
+def shift_rows_for_record(record, employee_name):
+    """Build the shifts of one cell record, adding the weekend for Friday "Guardia" """
+    shift = Shift(record['file'], record['date'], record['day'], record['shift_type'], employee_name)
+    rows = [shift]
+
+    if 'guardia' in shift.shift_type.lower() and shift.day.lower() == 'venerdì':
+        rows.append(shift.shifted(1, 'Sabato'))
+        rows.append(shift.shifted(2, 'Domenica'))
+
+    return rows
+
+def extract_all_employee_shifts(records, known_names):
+    """Report rows of every employee, built in a single pass over the cell records"""
+    name_index = as_name_index(known_names)
+    shifts_by_employee = {}
+
+    for record in records:
+        for employee_name in resolve_cell_names(record['text'], name_index):
+            if employee_name not in shifts_by_employee:
+                shifts_by_employee[employee_name] = []
+            shifts_by_employee[employee_name].extend(shift_rows_for_record(record, employee_name))
+
+    return shifts_by_employee
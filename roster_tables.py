@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from docx import Document
+
+# Parsed table grids of uploaded rosters, by content hash, shared by all sessions
+# (reserved folder of the upload folder, next to the roster store)
+GRID_CACHE_DIR = '_grids'
+# Bump when the grid layout changes so stale cache files are ignored
+GRID_CACHE_VERSION = 1
+
+# Grid cache of a roster folder (used by the CLI), next to a manifest of the files' mtime, size and hash
+FOLDER_CACHE_DIR = '.roster_cache'
+FOLDER_MANIFEST = 'manifest.json'
+
+# Table readers: the full python-docx object model, or the streaming XML reader below
+BACKENDS = ('python-docx', 'stream')
+DEFAULT_BACKEND = os.environ.get('TABLE_BACKEND', 'python-docx')
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+# Helper to hash a file's content (used as cache key for parsed grids)
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_docx_tables(filepath, backend=None):
+    """Parse a .docx and return its tables as grids of stripped cell texts.
+
+    Each table is a list of rows and each row a list of cell strings, so
+    table[0][1:] are the header days and row[0] is the shift type.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'stream':
+        return list(iter_docx_tables(filepath))
+    if backend != 'python-docx':
+        raise ValueError(f'Unknown table backend: {backend}')
+
+    doc = Document(filepath)
+    tables = []
+    for table in doc.tables:
+        tables.append([[cell.text.strip() for cell in row.cells] for row in table.rows])
+    return tables
+
+# Helper to find the main document part (normally word/document.xml)
+def _main_document_name(zf):
+    try:
+        rels = ET.fromstring(zf.read('_rels/.rels'))
+    except (KeyError, ET.ParseError):
+        return 'word/document.xml'
+    for rel in rels.iter(f'{REL_NS}Relationship'):
+        if rel.get('Type') == OFFICE_DOCUMENT_REL:
+            return rel.get('Target', 'word/document.xml').lstrip('/')
+    return 'word/document.xml'
+
+def _paragraph_text(p):
+    """Text of a w:p the way python-docx builds it: direct runs only, tabs and breaks mapped"""
+    text = []
+    for r in p.iterfind(f'{W_NS}r'):
+        for child in r:
+            if child.tag == f'{W_NS}t':
+                text.append(child.text or '')
+            elif child.tag == f'{W_NS}tab':
+                text.append('\t')
+            elif child.tag in (f'{W_NS}br', f'{W_NS}cr'):
+                text.append('\n')
+    return ''.join(text)
+
+def _cell_text(tc):
+    return '\n'.join(_paragraph_text(p) for p in tc.iterfind(f'{W_NS}p')).strip()
+
+def _table_grid(tbl):
+    """Lay out a w:tbl on its column grid, repeating merged cells like python-docx does"""
+    tbl_grid = tbl.find(f'{W_NS}tblGrid')
+    if tbl_grid is None:
+        raise ValueError('table has no w:tblGrid element')
+    col_count = len(tbl_grid.findall(f'{W_NS}gridCol'))
+
+    rows = tbl.findall(f'{W_NS}tr')
+    cells = []
+    for tr in rows:
+        for tc in tr.iterfind(f'{W_NS}tc'):
+            grid_span = 1
+            v_merge = None
+            tc_pr = tc.find(f'{W_NS}tcPr')
+            if tc_pr is not None:
+                span = tc_pr.find(f'{W_NS}gridSpan')
+                if span is not None:
+                    grid_span = int(span.get(f'{W_NS}val'))
+                merge = tc_pr.find(f'{W_NS}vMerge')
+                if merge is not None:
+                    v_merge = merge.get(f'{W_NS}val', 'continue')
+
+            for grid_span_idx in range(grid_span):
+                if v_merge == 'continue':
+                    cells.append(cells[-col_count])  # Vertically merged: the cell above
+                elif grid_span_idx > 0:
+                    cells.append(cells[-1])  # Horizontally merged: the cell to the left
+                else:
+                    cells.append(_cell_text(tc))
+
+    return [cells[i * col_count:(i + 1) * col_count] for i in range(len(rows))]
+
+def iter_docx_tables(filepath):
+    """Stream the top-level tables of a .docx without building the python-docx object model.
+
+    Yields one grid per table (same layout as read_docx_tables) as soon as the
+    table has been parsed; everything outside tables is discarded on the fly.
+    """
+    with zipfile.ZipFile(filepath) as zf:
+        with zf.open(_main_document_name(zf)) as xml_file:
+            depth = 0
+            for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                # Depth 2 is a direct child of w:body (w:document > w:body > ...)
+                if depth == 2:
+                    if elem.tag == f'{W_NS}tbl':
+                        yield _table_grid(elem)
+                    elem.clear()
+
+def compare_backends(filepath):
+    """Read a file with both backends and return (matches, python-docx seconds, stream seconds)"""
+    start = time.perf_counter()
+    expected = read_docx_tables(filepath, 'python-docx')
+    docx_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streamed = read_docx_tables(filepath, 'stream')
+    stream_seconds = time.perf_counter() - start
+
+    return expected == streamed, docx_seconds, stream_seconds
+
+def grid_cache_dir(upload_folder):
+    return os.path.join(upload_folder, GRID_CACHE_DIR)
+
+def session_cache_dir(session_dir):
+    """Return the grid cache folder used by a session: the one shared by its upload folder"""
+    return grid_cache_dir(os.path.dirname(session_dir))
+
+def folder_cache_dir(folder):
+    """Return the grid cache folder of a roster folder"""
+    return os.path.join(folder, FOLDER_CACHE_DIR)
+
+def refresh_folder_manifest(folder, filepaths):
+    """Return ({filepath: sha256}, changed filepaths) for files of a roster folder.
+
+    Files whose mtime and size match the saved manifest keep their hash
+    without being read; grids of files that are gone are dropped.
+    """
+    cache_dir = folder_cache_dir(folder)
+    manifest_path = os.path.join(cache_dir, FOLDER_MANIFEST)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    new_manifest = {}
+    hashes = {}
+    changed = []
+    for filepath in filepaths:
+        name = os.path.relpath(filepath, folder)
+        stat = os.stat(filepath)
+        entry = manifest.get(name)
+        if entry and entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            content_hash = entry['hash']
+        else:
+            content_hash = file_sha256(filepath)
+            changed.append(filepath)
+        new_manifest[name] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash}
+        hashes[filepath] = content_hash
+
+    if new_manifest != manifest:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(new_manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+
+        used = {entry['hash'] for entry in new_manifest.values()}
+        for cache_name in os.listdir(cache_dir):
+            if cache_name.endswith('.json') and cache_name != FOLDER_MANIFEST and cache_name[:-len('.json')] not in used:
+                os.remove(os.path.join(cache_dir, cache_name))
+
+    return hashes, changed
+
+def load_tables(filepath, cache_dir=None, backend=None, content_hash=None):
+    """Return the table grids of a .docx, parsing it only if no cached grid exists.
+
+    content_hash saves hashing the file again when the caller already knows it.
+    """
+    if cache_dir is None:
+        return read_docx_tables(filepath, backend)
+
+    cache_path = os.path.join(cache_dir, f'{content_hash or file_sha256(filepath)}.json')
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == GRID_CACHE_VERSION:
+                return cached['tables']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass  # Unreadable cache entry, parse the document again
+
+    tables = read_docx_tables(filepath, backend)
+
+    # Write to a temporary file first so readers never see a partial grid
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': GRID_CACHE_VERSION, 'tables': tables}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+    return tables
+
+if __name__ == '__main__':
+    # Comparison mode: check the streaming reader against python-docx
+    if len(sys.argv) < 2:
+        print("Usage: python roster_tables.py <file.docx or folder> [...]")
+        sys.exit(1)
+
+    paths = []
+    for arg in sys.argv[1:]:
+        if os.path.isdir(arg):
+            paths.extend(sorted(os.path.join(arg, f) for f in os.listdir(arg) if f.endswith('.docx') and not f.startswith('~$')))
+        else:
+            paths.append(arg)
+
+    mismatches = 0
+    total_docx = total_stream = 0.0
+    for path in paths:
+        try:
+            matches, docx_seconds, stream_seconds = compare_backends(path)
+        except Exception as e:
+            print(f"ERROR    {path}: {e}")
+            mismatches += 1
+            continue
+        total_docx += docx_seconds
+        total_stream += stream_seconds
+        if not matches:
+            mismatches += 1
+        print(f"{'OK' if matches else 'MISMATCH':8} {path} (python-docx {docx_seconds * 1000:.1f} ms, stream {stream_seconds * 1000:.1f} ms)")
+
+    print(f"{len(paths) - mismatches}/{len(paths)} files identical; python-docx {total_docx:.2f} s, stream {total_stream:.2f} s")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,255 @@
+import os
+import shutil
+import threading
+import time
+import roster_tables
+import upload_store
+
+# Stored rosters younger than this are never collected: a client may have just
+# negotiated them and not yet sent the manifest that references them
+STORE_GRACE_SECONDS = 3600
+
+def touch_session(session_dir):
+    """Mark a session as used now; the reaper evicts the least recently used sessions first"""
+    try:
+        os.utime(session_dir)
+    except OSError:
+        pass
+
+def dir_size(path):
+    """Total size in bytes of the files below a folder"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed meanwhile
+    return total
+
+def list_sessions(upload_folder):
+    """Return (last_used, session_id, session_dir) of every session, least recently used first"""
+    sessions = []
+    with os.scandir(upload_folder) as it:
+        for entry in it:
+            if entry.is_dir() and not upload_store.is_reserved(entry.name):
+                try:
+                    sessions.append((entry.stat().st_mtime, entry.name, entry.path))
+                except OSError:
+                    pass
+    return sorted(sessions)
+
+def collect_unreferenced(folder, referenced, now):
+    """Remove the files of a folder named <content hash>.<ext> whose hash is not referenced,
+    once older than the grace period; returns (files removed, bytes removed)"""
+    if not os.path.isdir(folder):
+        return 0, 0
+
+    removed_files = removed_bytes = 0
+    with os.scandir(folder) as it:
+        for entry in it:
+            content_hash = entry.name.split('.', 1)[0]
+            if content_hash in referenced:
+                continue
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime <= STORE_GRACE_SECONDS:
+                    continue
+                os.remove(entry.path)
+            except OSError:
+                continue
+            removed_files += 1
+            removed_bytes += stat.st_size
+    return removed_files, removed_bytes
+
+class SessionReaper:
+    """Removes expired sessions and keeps the upload folder under a disk quota, on a background thread"""
+
+    def __init__(self, upload_folder, ttl, quota_bytes, interval, is_busy=None):
+        self.upload_folder = upload_folder
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        # is_busy(session_id) protects sessions with a running job
+        self.is_busy = is_busy or (lambda session_id: False)
+        self.totals = {
+            'runs': 0,
+            'last_run': None,
+            'sessions_expired': 0,
+            'sessions_evicted': 0,
+            'store_files_removed': 0,
+            'grid_files_removed': 0,
+            'bytes_reclaimed': 0
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='session-reaper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Session reaper failed: {e}")
+
+    def _remove_session(self, session_id, session_dir):
+        if self.is_busy(session_id):
+            return None
+        size = dir_size(session_dir)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return size
+
+    def run_once(self):
+        """One reaping pass; returns what it reclaimed"""
+        with self._lock:
+            now = time.time()
+            run = {'sessions_expired': 0, 'sessions_evicted': 0, 'store_files_removed': 0, 'grid_files_removed': 0,
+                   'bytes_reclaimed': 0}
+
+            # Sessions not used within the TTL
+            remaining = []
+            for last_used, session_id, session_dir in list_sessions(self.upload_folder):
+                size = self._remove_session(session_id, session_dir) if now - last_used > self.ttl else None
+                if size is None:
+                    remaining.append((last_used, session_id, session_dir))
+                else:
+                    run['sessions_expired'] += 1
+                    run['bytes_reclaimed'] += size
+
+            # Over quota: evict the least recently used sessions worth evicting, then the rosters nobody references
+            for _, session_id, session_dir in self.plan_evictions(remaining, now):
+                size = self._remove_session(session_id, session_dir)
+                if size is not None:
+                    run['sessions_evicted'] += 1
+                    run['bytes_reclaimed'] += size
+
+            removed_files, removed_grids, removed_bytes = self.collect_store(now)
+            run['store_files_removed'] += removed_files
+            run['grid_files_removed'] += removed_grids
+            run['bytes_reclaimed'] += removed_bytes
+
+            for key, value in run.items():
+                self.totals[key] += value
+            self.totals['runs'] += 1
+            self.totals['last_run'] = now
+
+            if run['sessions_expired'] or run['sessions_evicted'] or run['store_files_removed'] or run['grid_files_removed']:
+                print(f"Session reaper: {run['sessions_expired']} expired, {run['sessions_evicted']} evicted, "
+                      f"{run['store_files_removed']} stored files and {run['grid_files_removed']} table grids removed, "
+                      f"{run['bytes_reclaimed']} bytes reclaimed")
+            return run
+
+    def shared_file_sizes(self):
+        """Return {content_hash: (bytes, newest mtime)} of the stored rosters and table grids"""
+        sizes = {}
+        for folder in (upload_store.store_dir(self.upload_folder), roster_tables.grid_cache_dir(self.upload_folder)):
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    content_hash = entry.name.split('.', 1)[0]
+                    size, mtime = sizes.get(content_hash, (0, 0))
+                    sizes[content_hash] = (size + stat.st_size, max(mtime, stat.st_mtime))
+        return sizes
+
+    def quota_usage(self, sessions=None):
+        """Bytes counted against the quota: sessions, stored rosters and table grids.
+        The summary and report caches keep to their own limits."""
+        if sessions is None:
+            sessions = list_sessions(self.upload_folder)
+        return (sum(dir_size(session_dir) for _, _, session_dir in sessions)
+                + sum(size for size, _ in self.shared_file_sizes().values()))
+
+    def plan_evictions(self, sessions, now):
+        """Pick the least recently used sessions to evict to get under the quota.
+
+        Sessions mostly hold references into the shared store, so evicting one
+        frees its rosters only when no other session uses them (and they are
+        past the grace period). The evictions are simulated in LRU order: the
+        shortest run that gets under the quota is evicted, or if none does, the
+        run up to the last eviction that actually frees rosters, so sessions
+        whose removal frees nothing are kept.
+        """
+        shared = self.shared_file_sizes()
+        session_sizes = {session_dir: dir_size(session_dir) for _, _, session_dir in sessions}
+        usage = sum(session_sizes.values()) + sum(size for size, _ in shared.values())
+        if usage <= self.quota_bytes:
+            return []
+
+        manifests = {session_dir: upload_store.load_manifest(session_dir) or {} for _, _, session_dir in sessions}
+        references = {}
+        for manifest in manifests.values():
+            for content_hash in {entry['hash'] for entry in manifest.values() if entry.get('hash')}:
+                references[content_hash] = references.get(content_hash, 0) + 1
+
+        planned = []
+        worth = 0
+        for session in sessions:
+            _, session_id, session_dir = session
+            if self.is_busy(session_id):
+                continue
+
+            manifest = manifests[session_dir]
+            # Sessions saved before the store keep their rosters inside
+            frees_rosters = any(not entry.get('hash') for entry in manifest.values())
+            freed = session_sizes[session_dir]
+            for content_hash in {entry['hash'] for entry in manifest.values() if entry.get('hash')}:
+                references[content_hash] -= 1
+                size, mtime = shared.get(content_hash, (0, now))
+                if references[content_hash] == 0 and size and now - mtime > STORE_GRACE_SECONDS:
+                    freed += size
+                    frees_rosters = True
+
+            usage -= freed
+            planned.append(session)
+            if frees_rosters or usage <= self.quota_bytes:
+                worth = len(planned)
+            if usage <= self.quota_bytes:
+                break
+
+        return planned[:worth]
+
+    def referenced_hashes(self):
+        """Content hashes of the rosters some session still references"""
+        referenced = set()
+        for _, _, session_dir in list_sessions(self.upload_folder):
+            manifest = upload_store.load_manifest(session_dir) or {}
+            referenced.update(entry['hash'] for entry in manifest.values() if entry.get('hash'))
+        return referenced
+
+    def collect_store(self, now):
+        """Remove stored rosters and table grids (and leftover temporary files) no session references any more.
+
+        Returns (stored files removed, grid files removed, bytes removed).
+        """
+        referenced = self.referenced_hashes()
+        removed_files, store_bytes = collect_unreferenced(upload_store.store_dir(self.upload_folder), referenced, now)
+        removed_grids, grid_bytes = collect_unreferenced(roster_tables.grid_cache_dir(self.upload_folder), referenced, now)
+        return removed_files, removed_grids, store_bytes + grid_bytes
+
+    def stats(self):
+        """Reclaimed totals plus the current usage of the upload folder"""
+        sessions = list_sessions(self.upload_folder)
+        with self._lock:
+            totals = dict(self.totals)
+        return {
+            **totals,
+            'sessions': len(sessions),
+            'bytes_used': dir_size(self.upload_folder),
+            'quota_bytes_used': self.quota_usage(sessions),
+            'ttl': self.ttl,
+            'quota_bytes': self.quota_bytes,
+            'interval': self.interval
+        }
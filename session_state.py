@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import metrics
+import roster_engine
+import roster_tables
+import upload_store
+
+# Per-file analysis results of a session, so files can be added or removed later
+SESSION_STATE_FILE = 'analysis_state.json'
+SESSION_STATE_VERSION = 2  # 2: per-date counts for filtered summaries
+
+# Serializes incremental updates within this process
+_update_lock = threading.Lock()
+
+def load_session_state(session_dir):
+    """Return the saved analysis state of a session, or None if there is no usable one"""
+    state_path = os.path.join(session_dir, SESSION_STATE_FILE)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('version') == SESSION_STATE_VERSION else None
+
+def save_session_state(session_dir, state):
+    state_path = os.path.join(session_dir, SESSION_STATE_FILE)
+    tmp_path = f'{state_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+def known_names(state):
+    """Union of the candidate names of every file in the state"""
+    names = set()
+    for entry in state['files'].values():
+        names.update(entry['names'])
+    return names
+
+def session_summary(state):
+    """Merge the per-file shift counts into the heatmap summary"""
+    summary = {}
+    for entry in state['files'].values():
+        for employee, counts in entry['counts'].items():
+            employee_counts = summary.setdefault(employee, {})
+            for shift_type, count in counts.items():
+                employee_counts[shift_type] = employee_counts.get(shift_type, 0) + count
+    return summary
+
+def filtered_summary(state, date_from=None, date_to=None, shift_types=None, employees=None):
+    """Heatmap summary limited to a date range (YYYY-MM-DD strings, both included), shift types and employees.
+
+    Answered from the per-date counts of each file; cells without a date only
+    count when no date range is given.
+    """
+    if not (date_from or date_to or shift_types or employees):
+        return session_summary(state)
+
+    shift_types = set(shift_types) if shift_types else None
+    employees = set(employees) if employees else None
+
+    summary = {}
+    for entry in state['files'].values():
+        for date_key, day_counts in entry['dates'].items():
+            if date_from or date_to:
+                if not date_key or (date_from and date_key < date_from) or (date_to and date_key > date_to):
+                    continue
+
+            for employee, counts in day_counts.items():
+                if employees is not None and employee not in employees:
+                    continue
+                for shift_type, count in counts.items():
+                    if shift_types is not None and shift_type not in shift_types:
+                        continue
+                    employee_counts = summary.setdefault(employee, {})
+                    employee_counts[shift_type] = employee_counts.get(shift_type, 0) + count
+    return summary
+
+def columnar_summary(summary):
+    """Heatmap summary as columns: every employee and shift type once, counts as a matrix.
+
+    The matrix is dense (a full row per employee) unless fewer than half of
+    its cells are set; then each row lists [column, count, column, count, ...].
+    """
+    employees = sorted(summary)
+    shift_types = sorted({shift_type for counts in summary.values() for shift_type in counts})
+    columns = {shift_type: i for i, shift_type in enumerate(shift_types)}
+
+    filled = sum(len(counts) for counts in summary.values())
+    sparse = filled * 2 < len(employees) * len(shift_types)
+
+    rows = []
+    for employee in employees:
+        counts = summary[employee]
+        if sparse:
+            row = []
+            for shift_type in sorted(counts, key=columns.get):
+                row.extend((columns[shift_type], counts[shift_type]))
+        else:
+            row = [counts.get(shift_type, 0) for shift_type in shift_types]
+        rows.append(row)
+
+    return {
+        'employees': employees,
+        'shift_types': shift_types,
+        'matrix': 'sparse' if sparse else 'dense',
+        'counts': rows,
+        'totals': [sum(summary[employee].values()) for employee in employees]
+    }
+
+def file_entry(original_filename, content_hash, file_names, file_records, name_index):
+    return {
+        'original': original_filename,
+        'hash': content_hash,
+        'names': sorted(file_names),
+        # Only files with partial-match cells are affected when the name set changes
+        'partial': any(roster_engine.needs_partial_lookup(record['text']) for record in file_records),
+        'counts': roster_engine.count_employee_shifts(file_records, name_index),
+        'dates': roster_engine.count_employee_shifts_by_date(file_records, name_index)
+    }
+
+def parse_session_files(session_dir, files, workers=None, backend=None, progress=None):
+    """Parse (secure_name, filepath, original_filename) triples of a session.
+
+    Returns {secure_name: (content_hash, file_names, file_records)}; a file
+    that fails to parse is logged and left out.
+    """
+    cache_dir = roster_tables.session_cache_dir(session_dir)
+    paths = [(filepath, original_filename) for _, filepath, original_filename in files]
+    # Hash only the files of older sessions, whose manifest has no hash
+    recorded = upload_store.session_file_hashes(session_dir)
+    hashes = {filepath: recorded.get(filepath) or roster_tables.file_sha256(filepath) for filepath, _ in paths}
+
+    parsed = {}
+    for (secure_name, _, _), (filepath, _), (original_filename, result, error) in zip(
+            files, paths, roster_engine.iter_parsed_files(paths, cache_dir, workers, backend, hashes)):
+        if progress is not None:
+            progress(original_filename, error)
+
+        if error is not None:
+            print(f"Error processing {original_filename}: {error}")
+            continue
+
+        file_names, file_records = result
+        parsed[secure_name] = (hashes[filepath], file_names, file_records)
+
+    return parsed
+
+def analyze_session(session_dir, workers=None, backend=None, progress=None):
+    """Analyze every roster of a session from scratch and save its per-file state"""
+    files = upload_store.session_files(session_dir)
+    with metrics.stage('parse'):
+        parsed = parse_session_files(session_dir, files, workers, backend, progress)
+
+    with metrics.stage('names'):
+        all_employee_names = set()
+        for _, file_names, _ in parsed.values():
+            all_employee_names.update(file_names)
+        name_index = roster_engine.NameIndex(all_employee_names)
+    metrics.count('names', len(all_employee_names))
+
+    with metrics.stage('count'):
+        state = {'version': SESSION_STATE_VERSION, 'files': {}}
+        for secure_name, _, original_filename in files:
+            if secure_name in parsed:
+                content_hash, file_names, file_records = parsed[secure_name]
+                state['files'][secure_name] = file_entry(original_filename, content_hash, file_names, file_records, name_index)
+
+    with metrics.stage('state'):
+        save_session_state(session_dir, state)
+    return state
+
+def indexed_session_state(session_dir, workers=None, backend=None):
+    """Saved state of a session for queries, analyzing the session first if it has none
+    (e.g. its summary came from the result cache, or was saved by an older version)"""
+    with _update_lock:
+        state = load_session_state(session_dir)
+        if state is None:
+            state = analyze_session(session_dir, workers, backend)
+        return state
+
+def update_session(session_dir, added=(), removed=(), workers=None, backend=None):
+    """Apply added or removed files to the saved state of a session.
+
+    added are secure names of files already in the session manifest (new or
+    replaced), removed are secure names already dropped from it. Only added
+    files whose content changed are parsed, and when the known-name set
+    changes only files with partial-match cells are recounted, from their
+    cached grids. Returns (state, changes).
+    """
+    with _update_lock:
+        state = load_session_state(session_dir)
+        if state is None:
+            # Session analyzed before per-file state existed
+            state = analyze_session(session_dir, workers, backend)
+            return state, {'parsed': [entry['original'] for entry in state['files'].values()], 'recomputed': [], 'removed': []}
+
+        old_names = known_names(state)
+
+        removed_files = []
+        for secure_name in removed:
+            entry = state['files'].pop(secure_name, None)
+            if entry is not None:
+                removed_files.append(entry['original'])
+
+        paths = {secure_name: (filepath, original_filename)
+                 for secure_name, filepath, original_filename in upload_store.session_files(session_dir)}
+        recorded = upload_store.session_file_hashes(session_dir)
+
+        to_parse = []
+        for secure_name in added:
+            filepath, original_filename = paths[secure_name]
+            entry = state['files'].get(secure_name)
+            if (entry is None or entry['original'] != original_filename
+                    or entry['hash'] != (recorded.get(filepath) or roster_tables.file_sha256(filepath))):
+                to_parse.append((secure_name, filepath, original_filename))
+        parsed = parse_session_files(session_dir, to_parse, workers, backend)
+
+        # A changed file that no longer parses drops out, like in a full analysis
+        for secure_name, _, _ in to_parse:
+            if secure_name not in parsed:
+                state['files'].pop(secure_name, None)
+
+        new_names = set()
+        for secure_name, entry in state['files'].items():
+            if secure_name not in parsed:
+                new_names.update(entry['names'])
+        for _, file_names, _ in parsed.values():
+            new_names.update(file_names)
+        name_index = roster_engine.NameIndex(new_names)
+
+        for secure_name, _, original_filename in to_parse:
+            if secure_name in parsed:
+                content_hash, file_names, file_records = parsed[secure_name]
+                state['files'][secure_name] = file_entry(original_filename, content_hash, file_names, file_records, name_index)
+
+        recomputed = []
+        if new_names != old_names:
+            cache_dir = roster_tables.session_cache_dir(session_dir)
+            for secure_name, entry in state['files'].items():
+                if entry['partial'] and secure_name not in parsed:
+                    _, file_records = roster_engine.parse_roster_file(paths[secure_name][0], entry['original'], cache_dir, backend,
+                                                                      entry['hash'])
+                    entry['counts'] = roster_engine.count_employee_shifts(file_records, name_index)
+                    entry['dates'] = roster_engine.count_employee_shifts_by_date(file_records, name_index)
+                    recomputed.append(entry['original'])
+
+        save_session_state(session_dir, state)
+        return state, {
+            'parsed': [original_filename for secure_name, _, original_filename in to_parse if secure_name in parsed],
+            'recomputed': recomputed,
+            'removed': removed_files
+        }
@@ -0,0 +1,58 @@
+import sys
+from datetime import date, timedelta
+
+def format_date(value):
+    """Report text of a shift date: YYYY-MM-DD, or '' when the date is unknown"""
+    return value.isoformat() if value is not None else ''
+
+def parse_date(text):
+    """Inverse of format_date"""
+    return date.fromisoformat(text) if text else None
+
+class Shift:
+    """One shift of an employee in a roster file.
+
+    Dates are date objects (None when unknown) and the strings repeated over
+    many shifts are interned; report text is only built by as_row().
+    """
+    __slots__ = ('file', 'date', 'day', 'shift_type', 'employee')
+
+    def __init__(self, file, date, day, shift_type, employee=None):
+        self.file = sys.intern(file)
+        self.date = date
+        self.day = sys.intern(day)
+        self.shift_type = sys.intern(shift_type)
+        self.employee = sys.intern(employee) if employee is not None else None
+
+    def shifted(self, days, day):
+        """The same shift a number of days later, on the given day name (e.g. the Friday "Guardia" weekend)"""
+        return Shift(self.file, self.date + timedelta(days=days) if self.date is not None else None,
+                     day, self.shift_type, self.employee)
+
+    @classmethod
+    def from_row(cls, row):
+        """Inverse of as_row"""
+        return cls(row['File'], parse_date(row['Data']), row['Giorno'], row['Turno'], row.get('Dipendente'))
+
+    def as_row(self):
+        """Report row with the Italian column names ('Dipendente' only if the employee is known)"""
+        row = {'File': self.file, 'Data': format_date(self.date), 'Giorno': self.day, 'Turno': self.shift_type}
+        if self.employee is not None:
+            row['Dipendente'] = self.employee
+        return row
+
+    def __eq__(self, other):
+        if not isinstance(other, Shift):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        # Hash follows __eq__ over the slots, so equal shifts collapse in sets and dict keys; do not change a hashed shift
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return f'Shift({self.file!r}, {self.date!r}, {self.day!r}, {self.shift_type!r}, {self.employee!r})'
+
+# Helper to sort shifts by date, unknown dates first (like the empty date strings they replace)
+def by_date(shift):
+    return (shift.date is not None, shift.date or date.min)
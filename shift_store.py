@@ -0,0 +1,243 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import extract_employee_shifts
+import roster_engine
+import roster_tables
+from shift_model import Shift, format_date, parse_date
+
+# Local database of every ingested roster, so questions don't need the docx files again
+DEFAULT_STORE_PATH = os.environ.get('SHIFT_STORE_PATH', 'shift_store.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    file_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    partial INTEGER NOT NULL,
+    ingested REAL NOT NULL,
+    UNIQUE (file_hash, filename)
+);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+
+-- Candidate names of each file; their union is the known-name set of the store
+CREATE TABLE IF NOT EXISTS file_names (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    PRIMARY KEY (file_id, name)
+);
+
+-- Raw cell records, kept to re-resolve names without the docx
+CREATE TABLE IF NOT EXISTS cells (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    day TEXT NOT NULL,
+    shift_type TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cells_file ON cells (file_id);
+
+-- Report rows (weekend of a Friday "Guardia" included); weight is the heatmap count of the row
+CREATE TABLE IF NOT EXISTS shifts (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    cell_id INTEGER NOT NULL,
+    row_index INTEGER NOT NULL,
+    employee TEXT NOT NULL,
+    date TEXT NOT NULL,
+    day TEXT NOT NULL,
+    shift_type TEXT NOT NULL,
+    weight INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shifts_file ON shifts (file_id);
+CREATE INDEX IF NOT EXISTS shifts_employee_date ON shifts (employee, date);
+CREATE INDEX IF NOT EXISTS shifts_date ON shifts (date);
+CREATE INDEX IF NOT EXISTS shifts_type_date ON shifts (shift_type, date);
+'''
+
+def connect(db_path=None):
+    """Open the store, creating its tables on first use"""
+    conn = sqlite3.connect(db_path or DEFAULT_STORE_PATH, timeout=30)
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def known_names(conn):
+    return {name for (name,) in conn.execute('SELECT DISTINCT name FROM file_names')}
+
+def store_file_shifts(conn, file_id, filename, name_index):
+    """(Re)build the shift rows of one stored file from its cell records"""
+    conn.execute('DELETE FROM shifts WHERE file_id = ?', (file_id,))
+
+    rows = []
+    for cell_id, date, day, shift_type, text in conn.execute(
+            'SELECT id, date, day, shift_type, text FROM cells WHERE file_id = ? ORDER BY id', (file_id,)):
+        record = {'file': filename, 'date': parse_date(date), 'day': day, 'shift_type': shift_type, 'text': text}
+        weekend = 'guardia' in shift_type.lower() and day.lower() == 'venerdì'
+
+        for employee_name in roster_engine.resolve_cell_names(text, name_index):
+            for row_index, shift in enumerate(roster_engine.shift_rows_for_record(record, employee_name)):
+                # The Friday row carries the whole weekend in the heatmap count
+                weight = (3 if weekend else 1) if row_index == 0 else 0
+                rows.append((file_id, cell_id, row_index, employee_name, format_date(shift.date), shift.day, shift_type, weight))
+
+    conn.executemany('INSERT INTO shifts VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+def ingest_files(files, db_path=None, cache_dir=None, workers=None, backend=None, hashes=None):
+    """Add (filepath, original_filename) pairs to the store.
+
+    Files are keyed by (content hash, filename), since dates come from the
+    filename: already stored pairs are skipped, and a new version of a
+    filename replaces the old one. When the known-name set changes, only
+    stored files with partial-match cells are re-resolved. hashes optionally
+    maps filepaths to their known content hash (e.g. from a session
+    manifest); other files are hashed here. Returns (ingested filenames,
+    skipped filenames).
+    """
+    known_hashes = hashes or {}
+    conn = connect(db_path)
+    try:
+        to_parse = []
+        skipped = []
+        hashes = {}
+        seen = set()
+        for filepath, original_filename in files:
+            content_hash = known_hashes.get(filepath) or roster_tables.file_sha256(filepath)
+            stored = conn.execute('SELECT 1 FROM files WHERE file_hash = ? AND filename = ?',
+                                  (content_hash, original_filename)).fetchone()
+            if stored or (content_hash, original_filename) in seen:
+                skipped.append(original_filename)
+            else:
+                to_parse.append((filepath, original_filename))
+                hashes[filepath] = content_hash
+                seen.add((content_hash, original_filename))
+
+        parsed = []
+        for (filepath, _), (original_filename, result, error) in zip(
+                to_parse, roster_engine.iter_parsed_files(to_parse, cache_dir, workers, backend, hashes)):
+            if error is not None:
+                print(f"Error processing {original_filename}: {error}")
+                continue
+            parsed.append((hashes[filepath], original_filename, result))
+
+        with conn:
+            old_names = known_names(conn)
+
+            new_file_ids = []
+            for content_hash, original_filename, (file_names, file_records) in parsed:
+                # A new version of the same week replaces the old one
+                conn.execute('DELETE FROM files WHERE filename = ?', (original_filename,))
+
+                partial = any(roster_engine.needs_partial_lookup(record['text']) for record in file_records)
+                file_id = conn.execute('INSERT INTO files (file_hash, filename, partial, ingested) VALUES (?, ?, ?, ?)',
+                                       (content_hash, original_filename, int(partial), time.time())).lastrowid
+                conn.executemany('INSERT INTO file_names VALUES (?, ?)', [(file_id, name) for name in file_names])
+                conn.executemany('INSERT INTO cells (file_id, date, day, shift_type, text) VALUES (?, ?, ?, ?, ?)',
+                                 [(file_id, format_date(record['date']), record['day'], record['shift_type'], record['text'])
+                                  for record in file_records])
+                new_file_ids.append((file_id, original_filename))
+
+            new_names = known_names(conn)
+            name_index = roster_engine.NameIndex(new_names)
+
+            for file_id, original_filename in new_file_ids:
+                store_file_shifts(conn, file_id, original_filename, name_index)
+
+            if new_names != old_names:
+                new_ids = {file_id for file_id, _ in new_file_ids}
+                for file_id, filename in conn.execute('SELECT id, filename FROM files WHERE partial = 1').fetchall():
+                    if file_id not in new_ids:
+                        store_file_shifts(conn, file_id, filename, name_index)
+
+        return [original_filename for _, original_filename, _ in parsed], skipped
+    finally:
+        conn.close()
+
+# Helper to build the WHERE clause shared by the queries
+def shift_filters(date_from=None, date_to=None, shift_types=None, employees=None):
+    clauses = []
+    params = []
+    if date_from:
+        clauses.append('date >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append('date <= ?')
+        params.append(date_to)
+    if shift_types:
+        clauses.append(f"shift_type IN ({', '.join('?' * len(shift_types))})")
+        params.extend(shift_types)
+    if employees:
+        clauses.append(f"employee IN ({', '.join('?' * len(employees))})")
+        params.extend(employees)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+def shift_summary(db_path=None, date_from=None, date_to=None, shift_types=None, employees=None):
+    """Heatmap summary {employee: {shift_type: count}} of the stored shifts.
+
+    Dates are ISO strings (YYYY-MM-DD); a Friday "Guardia" counts 3 on its Friday.
+    """
+    where, params = shift_filters(date_from, date_to, shift_types, employees)
+    conn = connect(db_path)
+    try:
+        summary = {}
+        for employee, shift_type, count in conn.execute(
+                f'SELECT employee, shift_type, SUM(weight) FROM shifts{where} GROUP BY employee, shift_type', params):
+            if count:
+                summary.setdefault(employee, {})[shift_type] = count
+        return summary
+    finally:
+        conn.close()
+
+def employee_shifts(employee_name, db_path=None, date_from=None, date_to=None, shift_types=None):
+    """Shifts of one employee in date order, as produced by the extraction code"""
+    where, params = shift_filters(date_from, date_to, shift_types, [employee_name])
+    conn = connect(db_path)
+    try:
+        query = (f'SELECT files.filename, date, day, shift_type, employee FROM shifts '
+                 f'JOIN files ON files.id = shifts.file_id{where} ORDER BY date, cell_id, row_index')
+        return [Shift(filename, parse_date(date), day, shift_type, employee)
+                for filename, date, day, shift_type, employee in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Store roster shifts in a local SQLite database and query them.')
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help=f'Database file (default: {DEFAULT_STORE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser('ingest', help='Add the .docx files of a folder to the store')
+    ingest_parser.add_argument('folder', nargs='?', default=extract_employee_shifts.TURNI_FOLDER)
+    ingest_parser.add_argument('--workers', type=int, default=0, help='Parsing processes (default: one per CPU core)')
+    ingest_parser.add_argument('--backend', choices=roster_tables.BACKENDS, default=None, help='Table reader')
+
+    for name, help_text in (('summary', 'Print shift counts per employee'), ('employee', "Export one employee's shifts")):
+        query_parser = commands.add_parser(name, help=help_text)
+        if name == 'employee':
+            query_parser.add_argument('employee_name')
+            query_parser.add_argument('--format', choices=extract_employee_shifts.EXPORT_FORMATS, default='xlsx')
+        query_parser.add_argument('--from', dest='date_from', help='First date (YYYY-MM-DD)')
+        query_parser.add_argument('--to', dest='date_to', help='Last date (YYYY-MM-DD)')
+        query_parser.add_argument('--shift-type', action='append', dest='shift_types', help='Only this shift type (repeatable)')
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        files = [(filepath, os.path.basename(filepath)) for filepath in extract_employee_shifts.get_docx_files(args.folder)]
+        ingested, skipped = ingest_files(files, args.db, workers=args.workers, backend=args.backend)
+        print(f"Ingested {len(ingested)} files, {len(skipped)} already stored")
+    elif args.command == 'summary':
+        summary = shift_summary(args.db, args.date_from, args.date_to, args.shift_types)
+        for employee in sorted(summary):
+            counts = ', '.join(f'{shift_type}: {count}' for shift_type, count in sorted(summary[employee].items()))
+            print(f"{employee}: {counts}")
+    else:
+        shifts = employee_shifts(args.employee_name, args.db, args.date_from, args.date_to, args.shift_types)
+        if not shifts:
+            print(f"No shifts found for {args.employee_name}")
+            sys.exit(1)
+        output_path = extract_employee_shifts.report_filename(args.employee_name, args.format)
+        extract_employee_shifts.write_shifts(shifts, output_path, args.format)
+        print(f"Exported {len(shifts)} shifts to {output_path}")
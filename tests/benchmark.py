@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Time the roster pipeline on generated rosters at several scales.
+
+Results are saved as JSON (benchmark_results/ by default) and compared with
+the previous run, or with --compare, to spot regressions:
+
+    python tests/benchmark.py --scales small,medium
+    python tests/benchmark.py --compare tests/benchmark_results/20250101-120000.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+# No background reaper while the app module is loaded for benchmarking
+os.environ.setdefault('REAPER_INTERVAL', '0')
+
+from generate_rosters import generate_rosters
+
+RESULTS_DIR = os.path.join(TESTS_DIR, 'benchmark_results')
+# name: (weeks, employees)
+SCALES = {
+    'small': (4, 15),
+    'medium': (26, 40),
+    'large': (104, 80)
+}
+# A benchmark slower than the previous run by more than this fraction is a regression
+DEFAULT_THRESHOLD = 0.2
+
+# Helper to time fn over a number of repeats; setup runs before each repeat, untimed
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # The app's progress prints are left out
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'best': min(times), 'repeat': repeat}
+
+def build_session(app, files):
+    """Put generated rosters in the upload store and create a session for them, like /analyze does"""
+    import roster_tables
+    import upload_store
+
+    manifest = {}
+    os.makedirs(upload_store.store_dir(app.UPLOAD_FOLDER), exist_ok=True)
+    for filepath, original_filename in files:
+        content_hash = roster_tables.file_sha256(filepath)
+        shutil.copyfile(filepath, upload_store.store_path(app.UPLOAD_FOLDER, content_hash))
+        manifest[app.secure_filename(original_filename)] = {'original': original_filename, 'hash': content_hash}
+
+    session_dir = tempfile.mkdtemp(dir=app.UPLOAD_FOLDER)
+    upload_store.save_manifest(session_dir, manifest)
+    return session_dir
+
+def run_scale(app, workdir, scale, weeks, employees, repeat):
+    import extract_employee_shifts
+    import roster_engine
+    import roster_tables
+    import result_cache
+    import session_state
+
+    files = generate_rosters(os.path.join(workdir, f'turni_{scale}'), weeks, employees, extras=False)
+    session_dir = build_session(app, files)
+    filenames = [original_filename for _, original_filename in files]
+
+    def clear_memos():
+        roster_engine.CELL_CANDIDATES_CACHE.clear()
+        roster_engine.CELL_NAMES_CACHE.clear()
+
+    def cold_session():
+        # Nothing left from earlier runs: no cached summary, state or table grids
+        clear_memos()
+        shutil.rmtree(result_cache.cache_dir(app.UPLOAD_FOLDER), ignore_errors=True)
+        shutil.rmtree(roster_tables.session_cache_dir(session_dir), ignore_errors=True)
+        state_path = os.path.join(session_dir, session_state.SESSION_STATE_FILE)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    results = {}
+    loops = max(1, 10000 // len(filenames))
+
+    def parse_filenames():
+        for _ in range(loops):
+            for filename in filenames:
+                extract_employee_shifts.extract_date_range_from_filename(filename)
+    results['extract_date_range_from_filename'] = measure(parse_filenames, repeat)
+    results['extract_date_range_from_filename']['calls'] = loops * len(filenames)
+
+    results['analyze_all_employees'] = measure(lambda: app.analyze_all_employees(session_dir), repeat, cold_session)
+    results['analyze_all_employees_cached'] = measure(lambda: app.analyze_all_employees(session_dir), repeat)
+
+    # Reports are made after the analysis, so the table grids are cached by then
+    all_employee_names, records = roster_engine.collect_cell_records(session_dir, 1)
+    employee_name = max(sorted(all_employee_names), key=lambda name: sum(name in record['text'] for record in records))
+    results['extract_with_mapping'] = measure(lambda: app.extract_with_mapping(employee_name, session_dir), repeat, clear_memos)
+
+    cell_texts = [record['text'] for record in records]
+    name_index = roster_engine.NameIndex(all_employee_names)
+
+    def resolve_cells():
+        for cell_text in cell_texts:
+            roster_engine.extract_employee_names_from_cell(cell_text, name_index)
+    results['extract_employee_names_from_cell'] = measure(resolve_cells, repeat, clear_memos)
+    results['extract_employee_names_from_cell']['calls'] = len(cell_texts)
+    results['extract_employee_names_from_cell_memoized'] = measure(resolve_cells, repeat)
+
+    shifts = [shift for employee_shifts in roster_engine.extract_all_employee_shifts(records, name_index).values()
+              for shift in employee_shifts]
+    output_path = os.path.join(workdir, f'bench_{scale}.xlsx')
+    results['write_to_xlsx'] = measure(lambda: extract_employee_shifts.write_to_xlsx(shifts, output_path), repeat)
+    results['write_to_xlsx']['rows'] = len(shifts)
+
+    return {'weeks': weeks, 'employees': employees, 'cells': len(cell_texts), 'benchmarks': results}
+
+def latest_results(folder):
+    """Path of the most recent results file in folder, or None"""
+    if not os.path.isdir(folder):
+        return None
+    paths = sorted(name for name in os.listdir(folder) if name.endswith('.json'))
+    return os.path.join(folder, paths[-1]) if paths else None
+
+def compare_results(previous, current, threshold):
+    """Print the change of every benchmark run in both; returns the regressions"""
+    regressions = []
+    for scale, scale_results in current['scales'].items():
+        previous_scale = previous.get('scales', {}).get(scale)
+        if previous_scale is None:
+            continue
+        for name, result in scale_results['benchmarks'].items():
+            before = previous_scale['benchmarks'].get(name)
+            if before is None or not before['median']:
+                continue
+            change = result['median'] / before['median'] - 1
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append((scale, name, change))
+            print(f"  {scale:<8} {name:<45} {before['median'] * 1000:10.2f} ms -> {result['median'] * 1000:10.2f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the roster pipeline on generated rosters.')
+    parser.add_argument('--scales', default='small,medium',
+                        help=f"comma separated scales among {', '.join(SCALES)} (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the median is kept (default: 3)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='parsing processes for the analysis, 0 = one per CPU core (default: 1)')
+    parser.add_argument('--backend', choices=['python-docx', 'stream'], default='python-docx')
+    parser.add_argument('--output', help=f'results file (default: a new timestamped file in {RESULTS_DIR})')
+    parser.add_argument('--compare', help='results file to compare with (default: the latest in the results folder)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='slowdown fraction reported as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    scales = args.scales.split(',')
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale: {', '.join(unknown)}")
+
+    compare_path = args.compare or latest_results(RESULTS_DIR)
+    output_path = args.output or os.path.join(RESULTS_DIR, f'{datetime.now():%Y%m%d-%H%M%S}.json')
+
+    workdir = tempfile.mkdtemp(prefix='roster_bench_')
+    cwd = os.getcwd()
+    try:
+        # The app keeps its uploads relative to the working directory
+        os.chdir(workdir)
+        import app
+        app.app.config['PARSE_WORKERS'] = args.workers
+        app.app.config['TABLE_BACKEND'] = args.backend
+
+        current = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'backend': args.backend,
+            'scales': {}
+        }
+        for scale in scales:
+            weeks, employees = SCALES[scale]
+            print(f'Benchmarking {scale}: {weeks} weeks, {employees} employees')
+            current['scales'][scale] = run_scale(app, workdir, scale, weeks, employees, args.repeat)
+            for name, result in current['scales'][scale]['benchmarks'].items():
+                print(f"  {name:<45} {result['median'] * 1000:10.2f} ms (best {result['best'] * 1000:.2f} ms)")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    print(f'Saved results to {output_path}')
+
+    if compare_path and os.path.abspath(compare_path) != os.path.abspath(output_path):
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f'Compared with {compare_path}:')
+        regressions = compare_results(previous, current, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmarks slower by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Generate synthetic weekly roster .docx files, laid out like the real ones in turni/"""
+
+import argparse
+import os
+import random
+from datetime import date, timedelta
+from docx import Document
+
+SURNAMES = [
+    'Rossi', 'Bianchi', 'Verdi', 'Russo', 'Ferrari', 'Esposito', 'Romano', 'Colombo', 'Ricci', 'Marino',
+    'Greco', 'Bruno', 'Gallo', 'Conti', 'Costa', 'Giordano', 'Mancini', 'Rizzo', 'Lombardi', 'Moretti',
+    'Barbieri', 'Fontana', 'Santoro', 'Mariani', 'Rinaldi', 'Caruso', 'Ferrara', 'Galli', 'Martini', 'Leone',
+    'Longo', 'Gentile', 'Martinelli', 'Vitale', 'Serra', 'Coppola', 'Ostardo', 'Olivieri', 'Neri', 'Pellegrini'
+]
+PREFIXES = ['', 'Di ', 'De ', 'Lo ', 'La ']
+SHIFT_TYPES = ['Guardia', 'Reparto', 'Ambulatorio', 'Sala Operatoria', 'Reperibilità', 'Assenti']
+DAYS = ['Lunedì', 'Martedì', 'Mercoledì', 'Giovedì', 'Venerdì']
+ROMAN_NUMERALS = ['I', 'II', 'III', 'IV']
+# Parentheses the parser must drop: times and shift notes
+NOTES = ['8-14', '14:00-20:00', 'turno lungo', '6 ore', 'h 12']
+
+# The three date formats of the real filenames (see extract_date_range_from_filename)
+FILENAME_FORMATS = ('slash', 'colon-year', 'colon')
+
+def employee_names(count, seed=0):
+    """Return count distinct surnames, some with Di/De/Lo/La prefixes or an initial"""
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = rng.choice(PREFIXES) + rng.choice(SURNAMES)
+        if name in seen:
+            name = f'{name} {rng.choice("ABCDEFGHILMNOPRSTV")}.'
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def roster_filename(number, monday, fmt):
+    """Original filename of the week starting on monday, e.g. '57. 25/11/24 - 29/11/24.docx'"""
+    friday = monday + timedelta(days=4)
+    if fmt == 'slash':
+        dates = f'{monday:%d/%m/%y} - {friday:%d/%m/%y}'
+    elif fmt == 'colon-year':
+        dates = f'{monday:%d:%m:%y} - {friday:%d:%m:%y}'
+    else:
+        dates = f'{monday:%d:%m} - {friday:%d:%m}'
+    return f'{number}. {dates}.docx'
+
+def disk_filename(original_filename):
+    """Name to save a roster under: '/' is not allowed in filenames, ':' gives the same dates"""
+    return original_filename.replace('/', ':')
+
+def cell_text(rng, names, max_people=3):
+    """Text of one roster cell: a few employees, some annotated like in the real tables"""
+    parts = []
+    for name in rng.sample(names, rng.randint(0, min(max_people, len(names)))):
+        x = rng.random()
+        if x < 0.15:
+            name = f'{name} ({rng.choice(ROMAN_NUMERALS)})'
+        elif x < 0.25:
+            # Covering for a colleague: both are on the shift
+            name = f'{name} ({rng.choice(names)})'
+        elif x < 0.35:
+            name = f'{name} ({rng.choice(NOTES)})'
+        elif x < 0.40:
+            # Only part of the surname, resolved against the known names
+            name = name.split()[-1] if ' ' in name else name
+        parts.append(name)
+    return rng.choice([', ', '\n']).join(parts)
+
+def write_roster(filepath, names, shift_types, rng, merged_cells=True):
+    """Write a one-table roster: a header row of days, then one row per shift type"""
+    doc = Document()
+    doc.add_paragraph('Turni settimanali')
+    table = doc.add_table(rows=len(shift_types) + 1, cols=len(DAYS) + 1)
+    table.cell(0, 0).text = 'Turno'
+    for col, day in enumerate(DAYS, 1):
+        table.cell(0, col).text = day
+    for row, shift_type in enumerate(shift_types, 1):
+        table.cell(row, 0).text = shift_type
+        for col in range(1, len(DAYS) + 1):
+            table.cell(row, col).text = cell_text(rng, names)
+
+    if merged_cells and len(shift_types) > 1:
+        # A shift covering two days, and one person on two shift types the same day
+        row = rng.randint(1, len(shift_types))
+        col = rng.randint(1, len(DAYS) - 1)
+        table.cell(row, col).merge(table.cell(row, col + 1))
+        col = rng.choice([c for c in range(1, len(DAYS) + 1) if row > 2 or c not in (col, col + 1)])
+        table.cell(1, col).merge(table.cell(2, col))
+
+    doc.save(filepath)
+
+def generate_rosters(folder, weeks=6, employees=20, shift_types=None, start=date(2024, 11, 4),
+                     seed=0, merged_cells=True, formats=FILENAME_FORMATS, extras=True):
+    """Write weeks of rosters into folder, cycling through the filename formats.
+
+    Returns (filepath, original_filename) pairs. With extras, a Word lock file
+    and a numbered copy are added too, which get_docx_files must skip.
+    """
+    shift_types = shift_types or SHIFT_TYPES
+    names = employee_names(employees, seed)
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    files = []
+    for week in range(weeks):
+        monday = start + timedelta(weeks=week)
+        original_filename = roster_filename(50 + week, monday, formats[week % len(formats)])
+        filepath = os.path.join(folder, disk_filename(original_filename))
+        write_roster(filepath, names, shift_types, rng, merged_cells and week % 2 == 0)
+        files.append((filepath, original_filename))
+
+    if extras:
+        Document().save(os.path.join(folder, '~$temp.docx'))
+        Document().save(os.path.join(folder, '90_. copia.docx'))
+
+    return files
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic weekly roster .docx files.')
+    parser.add_argument('folder', help='where to write the rosters (e.g. ../turni)')
+    parser.add_argument('--weeks', type=int, default=6)
+    parser.add_argument('--employees', type=int, default=20)
+    parser.add_argument('--shift-types', help='comma separated shift types (default: %(default)s)',
+                        default=','.join(SHIFT_TYPES))
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2024, 11, 4),
+                        help='Monday of the first week, YYYY-MM-DD (default: 2024-11-04)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-merged-cells', dest='merged_cells', action='store_false')
+    parser.add_argument('--no-extras', dest='extras', action='store_false',
+                        help='do not add the temporary/numbered files the parser skips')
+    args = parser.parse_args()
+
+    files = generate_rosters(args.folder, args.weeks, args.employees, args.shift_types.split(','), args.start,
+                             args.seed, args.merged_cells, extras=args.extras)
+    print(f'Wrote {len(files)} rosters to {args.folder}')
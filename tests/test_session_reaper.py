@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Check the session reaper's disk quota when the shared roster store holds most of the bytes.
+
+    python tests/test_session_reaper.py   (or pytest tests/test_session_reaper.py)
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_reaper
+import upload_store
+
+HOUR = 3600
+
+# Helper to put a roster of the given size in the store, last used age seconds ago
+def store_roster(upload_folder, name, size, age):
+    content_hash = name * 64
+    path = upload_store.store_path(upload_folder, content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    os.utime(path, (time.time() - age, time.time() - age))
+    return content_hash
+
+# Helper to create a session referencing stored rosters, last used age seconds ago
+def make_session(upload_folder, session_id, hashes, age):
+    session_dir = os.path.join(upload_folder, session_id)
+    os.makedirs(session_dir)
+    upload_store.save_manifest(session_dir, {f'{i}.docx': {'original': f'{i}.docx', 'hash': content_hash}
+                                             for i, content_hash in enumerate(hashes)})
+    os.utime(session_dir, (time.time() - age, time.time() - age))
+    return session_dir
+
+def sessions_left(upload_folder):
+    return sorted(session_id for _, session_id, _ in session_reaper.list_sessions(upload_folder))
+
+def test_shared_recent_roster_keeps_sessions():
+    # Five sessions in use share one roster: evicting them would free nothing
+    upload_folder = tempfile.mkdtemp()
+    try:
+        roster = store_roster(upload_folder, 'a', 1024 * 1024, 0)
+        for i in range(5):
+            make_session(upload_folder, f's{i}', [roster], 60 * (5 - i))
+
+        run = session_reaper.SessionReaper(upload_folder, 24 * HOUR, 900 * 1024, 0).run_once()
+
+        assert run['sessions_evicted'] == 0, run
+        assert sessions_left(upload_folder) == ['s0', 's1', 's2', 's3', 's4']
+    finally:
+        shutil.rmtree(upload_folder)
+
+def test_old_sessions_evicted_recent_kept():
+    # Two old sessions with their own old rosters, three recent ones sharing a new roster
+    upload_folder = tempfile.mkdtemp()
+    try:
+        old_rosters = [store_roster(upload_folder, name, 400 * 1024, 5 * HOUR) for name in 'bc']
+        make_session(upload_folder, 'old0', [old_rosters[0]], 3 * HOUR)
+        make_session(upload_folder, 'old1', [old_rosters[1]], 2 * HOUR)
+        roster = store_roster(upload_folder, 'a', 1024 * 1024, 0)
+        for i in range(3):
+            make_session(upload_folder, f'new{i}', [roster], 60 * (3 - i))
+
+        reaper = session_reaper.SessionReaper(upload_folder, 24 * HOUR, 1200 * 1024, 0)
+        run = reaper.run_once()
+
+        # The old rosters go with their sessions and bring the folder under the quota
+        assert run['sessions_evicted'] == 2, run
+        assert run['store_files_removed'] == 2, run
+        assert sessions_left(upload_folder) == ['new0', 'new1', 'new2']
+        assert reaper.quota_usage() <= 1200 * 1024
+    finally:
+        shutil.rmtree(upload_folder)
+
+def test_stops_after_last_useful_eviction():
+    # Still over the quota after freeing the old roster: the recent sessions stay
+    upload_folder = tempfile.mkdtemp()
+    try:
+        old_roster = store_roster(upload_folder, 'b', 100 * 1024, 5 * HOUR)
+        make_session(upload_folder, 'old', [old_roster], 2 * HOUR)
+        roster = store_roster(upload_folder, 'a', 1024 * 1024, 0)
+        for i in range(3):
+            make_session(upload_folder, f'new{i}', [roster], 60 * (3 - i))
+
+        run = session_reaper.SessionReaper(upload_folder, 24 * HOUR, 512 * 1024, 0).run_once()
+
+        assert run['sessions_evicted'] == 1, run
+        assert sessions_left(upload_folder) == ['new0', 'new1', 'new2']
+    finally:
+        shutil.rmtree(upload_folder)
+
+def test_caches_left_out_of_the_quota():
+    # Cached summaries and reports have their own limits
+    upload_folder = tempfile.mkdtemp()
+    try:
+        roster = store_roster(upload_folder, 'a', 10 * 1024, 5 * HOUR)
+        make_session(upload_folder, 's0', [roster], HOUR)
+        os.makedirs(os.path.join(upload_folder, '_reports'))
+        with open(os.path.join(upload_folder, '_reports', 'report.xlsx'), 'wb') as f:
+            f.write(os.urandom(1024 * 1024))
+
+        run = session_reaper.SessionReaper(upload_folder, 24 * HOUR, 100 * 1024, 0).run_once()
+
+        assert run['sessions_evicted'] == 0, run
+        assert sessions_left(upload_folder) == ['s0']
+    finally:
+        shutil.rmtree(upload_folder)
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')
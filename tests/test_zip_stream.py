@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Check that zip_stream reads highly compressed members to the end.
+
+    python tests/test_zip_stream.py   (or pytest tests/test_zip_stream.py)
+"""
+
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zip_stream
+
+# Helper to build a deflated .zip in memory from {name: data}
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+# Helper to read every member back as {name: data}
+def read_zip(data, **limits):
+    return {name: b''.join(chunks) for name, chunks in zip_stream.iter_zip_members(io.BytesIO(data), **limits)}
+
+def test_output_buffered_in_zlib_is_not_lost():
+    # Each member is a few KiB compressed: zlib still holds most of its output once the input is read
+    members = {'a.docx': b'\0' * (30 * 1024 * 1024) + b'x', 'b.docx': b'\0' * (30 * 1024 * 1024) + b'y'}
+    assert read_zip(make_zip(members)) == members
+
+def test_unread_members_are_skipped():
+    members = {'a.docx': b'\0' * (3 * 1024 * 1024) + b'x', 'b.docx': b'roster'}
+    names = [name for name, _ in zip_stream.iter_zip_members(io.BytesIO(make_zip(members)))]
+    assert names == ['a.docx', 'b.docx']
+
+def test_truncated_member():
+    data = make_zip({'a.docx': os.urandom(64 * 1024)})
+    try:
+        read_zip(data[:len(data) // 2])
+    except zip_stream.ZipStreamError:
+        pass
+    else:
+        raise AssertionError('truncated archive was accepted')
+
+# Helper to check that reading data raises ZipTooLargeError
+def assert_too_large(data, **limits):
+    try:
+        read_zip(data, **limits)
+    except zip_stream.ZipTooLargeError:
+        pass
+    else:
+        raise AssertionError('archive over its limits was accepted')
+
+def test_budget_counts_every_member():
+    # No member is over max_size, but together they unpack to more than the budget
+    data = make_zip({f'{i}.docx': b'\0' * (2 * 1024 * 1024) for i in range(4)})
+    assert_too_large(data, max_size=4 * 1024 * 1024, budget=zip_stream.ArchiveBudget(max_total=6 * 1024 * 1024))
+    assert len(read_zip(data, budget=zip_stream.ArchiveBudget(max_total=8 * 1024 * 1024))) == 4
+
+def test_budget_shared_by_archives():
+    budget = zip_stream.ArchiveBudget(max_members=3)
+    read_zip(make_zip({'a.docx': b'a', 'b.docx': b'b'}), budget=budget)
+    assert_too_large(make_zip({'c.docx': b'c', 'd.docx': b'd'}), budget=budget)
+
+def test_member_over_max_size():
+    assert_too_large(make_zip({'a.docx': b'\0' * 1024}), max_size=1000)
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')
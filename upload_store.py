@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+# Uploaded rosters are stored once by content hash, in a folder shared by all sessions.
+# Folders of the upload folder starting with '_' are reserved, never sessions.
+STORE_DIR = '_store'
+MANIFEST_FILE = 'manifest.json'
+LEGACY_MAPPING_FILE = 'filename_mapping.txt'
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+def is_reserved(name):
+    return name.startswith('_')
+
+def store_dir(upload_folder):
+    return os.path.join(upload_folder, STORE_DIR)
+
+def store_path(upload_folder, content_hash):
+    """Path of a stored roster; content_hash must be a lowercase SHA-256 hex digest"""
+    if not SHA256_RE.match(content_hash):
+        raise ValueError(f'Invalid content hash: {content_hash}')
+    return os.path.join(store_dir(upload_folder), f'{content_hash}.docx')
+
+def has_file(upload_folder, content_hash):
+    return bool(SHA256_RE.match(content_hash or '')) and os.path.exists(store_path(upload_folder, content_hash))
+
+def claim_file(upload_folder, content_hash):
+    """Check a roster is stored and refresh its mtime, so the session reaper keeps it a while"""
+    if not has_file(upload_folder, content_hash):
+        return False
+    try:
+        os.utime(store_path(upload_folder, content_hash))
+    except OSError:
+        return False  # Collected meanwhile
+    return True
+
+def missing_hashes(upload_folder, hashes):
+    """Return the hashes (in order, without duplicates) the store does not have yet"""
+    missing = []
+    for content_hash in hashes:
+        if not claim_file(upload_folder, content_hash) and content_hash not in missing:
+            missing.append(content_hash)
+    return missing
+
+def save_to_store(upload_folder, file):
+    """Stream an uploaded file into the store, hashing it on the way; returns its hash"""
+    return save_chunks_to_store(upload_folder, iter(lambda: file.stream.read(1024 * 1024), b''))
+
+def save_chunks_to_store(upload_folder, chunks):
+    """Write data arriving in chunks (e.g. a member of an uploaded .zip) into the store; returns its hash"""
+    folder = store_dir(upload_folder)
+    os.makedirs(folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = digest.hexdigest()
+        target = store_path(upload_folder, content_hash)
+        if claim_file(upload_folder, content_hash):
+            os.remove(tmp_path)  # Already stored by an earlier upload
+        else:
+            os.replace(tmp_path, target)
+        return content_hash
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_manifest(session_dir):
+    """Return the manifest {secure_name: {'original', 'hash'}} of a session, or None for older sessions"""
+    try:
+        with open(os.path.join(session_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(session_dir, manifest):
+    manifest_path = os.path.join(session_dir, MANIFEST_FILE)
+    tmp_path = f'{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def legacy_manifest(session_dir):
+    """Build a manifest for a session saved before the store existed (files inside the session)"""
+    filename_mapping = {}
+    mapping_file = os.path.join(session_dir, LEGACY_MAPPING_FILE)
+    if os.path.exists(mapping_file):
+        with open(mapping_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if ':' in line:
+                    temp_name, original_name = line.strip().split(':', 1)
+                    filename_mapping[temp_name] = original_name
+
+    manifest = {}
+    for secure_fname in os.listdir(session_dir):
+        if secure_fname.endswith('.docx'):
+            manifest[secure_fname] = {'original': filename_mapping.get(secure_fname, secure_fname), 'hash': None}
+    return manifest
+
+def session_manifest(session_dir):
+    manifest = load_manifest(session_dir)
+    return manifest if manifest is not None else legacy_manifest(session_dir)
+
+def entry_path(session_dir, secure_name, entry):
+    """Where the file of a manifest entry lives: the store, or the session itself for older sessions"""
+    if entry.get('hash'):
+        return store_path(os.path.dirname(session_dir), entry['hash'])
+    return os.path.join(session_dir, secure_name)
+
+def session_file_hashes(session_dir):
+    """Return {filepath: content_hash} of the rosters of a session whose hash the manifest records"""
+    return {entry_path(session_dir, secure_name, entry): entry['hash']
+            for secure_name, entry in session_manifest(session_dir).items() if entry.get('hash')}
+
+def session_files(session_dir):
+    """Return (secure_name, filepath, original_filename) of every roster of a session"""
+    return [(secure_name, entry_path(session_dir, secure_name, entry), entry['original'])
+            for secure_name, entry in session_manifest(session_dir).items()]
@@ -0,0 +1,200 @@
+import struct
+import zlib
+
+# Read a .zip front to back from a non-seekable stream (e.g. a request body), one member at a time.
+# Unlike zipfile this never needs the central directory at the end of the archive.
+LOCAL_HEADER = b'PK\x03\x04'
+CENTRAL_HEADER = b'PK\x01\x02'
+END_OF_CENTRAL_DIR = b'PK\x05\x06'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+# signature, version, flags, method, time, date, crc32, compressed size, size, name length, extra length
+LOCAL_HEADER_STRUCT = struct.Struct('<4sHHHHHIIIHH')
+ZIP64_EXTRA_ID = 0x0001
+
+STORED = 0
+DEFLATED = 8
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+CHUNK_SIZE = 1024 * 1024
+
+class ZipStreamError(ValueError):
+    """The archive is truncated, corrupt or uses features a stream cannot be read with"""
+
+class ZipTooLargeError(ZipStreamError):
+    """The archive unpacks to more members or bytes than allowed"""
+
+class ArchiveBudget:
+    """Members and uncompressed bytes one upload may unpack to, shared by all of its archives.
+
+    Members the caller skips count too: they are inflated all the same.
+    """
+
+    def __init__(self, max_total=None, max_members=None):
+        self.max_total = max_total
+        self.max_members = max_members
+        self.total = 0
+        self.members = 0
+
+    def add_member(self):
+        self.members += 1
+        if self.max_members is not None and self.members > self.max_members:
+            raise ZipTooLargeError(f'more than {self.max_members} members')
+
+    def add_bytes(self, name, size):
+        self.total += size
+        if self.max_total is not None and self.total > self.max_total:
+            raise ZipTooLargeError(f'unpacks to more than {self.max_total} bytes (at {name})')
+
+class _Reader:
+    """Stream reader that can put back bytes read past the end of a member"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = b''
+
+    def read(self, size):
+        """Up to size bytes, b'' at the end of the stream"""
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise ZipStreamError('Truncated ZIP archive')
+            data += chunk
+        return data
+
+    def skip(self, size):
+        while size > 0:
+            size -= len(self.read_exact(min(size, CHUNK_SIZE)))
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+# Helper to find the ZIP64 extra field of a local header: (size, compressed size), or None
+def _zip64_sizes(extra):
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, offset)
+        if header_id == ZIP64_EXTRA_ID and length >= 16:
+            return struct.unpack_from('<QQ', extra, offset + 4)
+        offset += 4 + length
+    return None
+
+def _stored_chunks(reader, compressed_size):
+    remaining = compressed_size
+    while remaining > 0:
+        chunk = reader.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            raise ZipStreamError('Truncated ZIP archive')
+        remaining -= len(chunk)
+        yield chunk
+
+def _deflated_chunks(reader, compressed_size):
+    """Inflate a member; without a known size (data descriptor) the deflate stream marks its own end"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    remaining = compressed_size
+    data = b''
+    while not decompressor.eof:
+        try:
+            # Bounded output, so a small highly compressed member cannot fill the memory at once
+            chunk = decompressor.decompress(data, CHUNK_SIZE)
+        except zlib.error as e:
+            raise ZipStreamError(f'Corrupt ZIP member: {e}')
+        data = decompressor.unconsumed_tail
+        if chunk:
+            yield chunk
+        elif not data and not decompressor.eof:
+            # zlib has no output left for what it was given: only now read more of the member
+            if remaining == 0:
+                raise ZipStreamError('Truncated ZIP archive')
+            data = reader.read(CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE))
+            if not data:
+                raise ZipStreamError('Truncated ZIP archive')
+            if remaining is not None:
+                remaining -= len(data)
+
+    # Bytes read past the deflate stream belong to the data descriptor or the next header
+    reader.unread(decompressor.unused_data)
+    if remaining:
+        reader.skip(remaining)
+
+def _member_chunks(reader, name, flags, method, crc, compressed_size, zip64, max_size, budget):
+    """Uncompressed data of one member, checked against its CRC-32, max_size and the budget"""
+    if flags & FLAG_DATA_DESCRIPTOR:
+        if method != DEFLATED:
+            raise ZipStreamError(f'{name}: stored members without sizes cannot be streamed')
+        compressed_size = None
+
+    chunks = _stored_chunks(reader, compressed_size) if method == STORED else _deflated_chunks(reader, compressed_size)
+    actual_crc = 0
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise ZipTooLargeError(f'{name} is larger than {max_size} bytes')
+        if budget is not None:
+            budget.add_bytes(name, len(chunk))
+        actual_crc = zlib.crc32(chunk, actual_crc)
+        yield chunk
+
+    if flags & FLAG_DATA_DESCRIPTOR:
+        # The signature of the descriptor is optional
+        signature = reader.read_exact(4)
+        if signature != DATA_DESCRIPTOR:
+            reader.unread(signature)
+        crc = struct.unpack('<I', reader.read_exact(4))[0]
+        reader.skip(16 if zip64 else 8)
+
+    if actual_crc != crc:
+        raise ZipStreamError(f'{name}: CRC-32 mismatch')
+
+def iter_zip_members(stream, max_size=None, budget=None):
+    """Yield (name, chunks) for each member of a .zip read sequentially from stream.
+
+    chunks iterates over the uncompressed data of the member; whatever the
+    caller leaves unread is skipped when it asks for the next member. Only
+    stored and deflated members are supported, and no encryption. max_size
+    limits the uncompressed size of each member, an ArchiveBudget the
+    members and bytes of all archives it is passed with; going over either
+    raises ZipTooLargeError.
+    """
+    reader = _Reader(stream)
+    while True:
+        start = reader.read(4)
+        if not start:
+            return  # No central directory, but every member was read
+        signature = start + reader.read_exact(4 - len(start))
+        if signature in (CENTRAL_HEADER, END_OF_CENTRAL_DIR):
+            return
+        if signature != LOCAL_HEADER:
+            raise ZipStreamError('Not a ZIP archive')
+
+        (_, _, flags, method, _, _, crc, compressed_size, _, name_length,
+         extra_length) = LOCAL_HEADER_STRUCT.unpack(signature + reader.read_exact(LOCAL_HEADER_STRUCT.size - 4))
+        name = reader.read_exact(name_length).decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+        extra = reader.read_exact(extra_length)
+
+        if flags & FLAG_ENCRYPTED:
+            raise ZipStreamError(f'{name} is encrypted')
+        if method not in (STORED, DEFLATED):
+            raise ZipStreamError(f'{name}: unsupported compression method {method}')
+
+        zip64_sizes = _zip64_sizes(extra)
+        if zip64_sizes is not None and compressed_size == 0xFFFFFFFF:
+            compressed_size = zip64_sizes[1]
+
+        if budget is not None:
+            budget.add_member()
+        chunks = _member_chunks(reader, name, flags, method, crc, compressed_size, zip64_sizes is not None, max_size, budget)
+        yield name, chunks
+
+        # Skip what the caller did not read
+        for _ in chunks:
+            pass